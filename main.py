@@ -1,44 +1,137 @@
+from __future__ import annotations
+
+import time
+
+BOOT_STARTED = time.perf_counter()
+
 import os
+import sys
 import asyncio
 import aiohttp
 import discord
 from discord import app_commands
 from discord.ext import commands
-from urllib.parse import quote, quote_plus
+from urllib.parse import quote, quote_plus, urlsplit
 import io
 import datetime as dt
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import FuncFormatter
-import pandas as pd
-import yfinance as yf
-import difflib
-from duckduckgo_search import DDGS
-import openai
+import csv
 import base64
+import hashlib
+import importlib
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import random
+import re
+import threading
+from zoneinfo import ZoneInfo
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+class Lazy:
+    """Stand-in for a heavy module or object, built on first use.
+
+    Attribute access, calls and attribute assignment are forwarded to the real
+    object, so call sites read as if it had been imported eagerly.
+    """
+
+    def __init__(self, name: str, factory):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def _load(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    object.__setattr__(self, "_target", self._factory())
+        return self._target
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __bool__(self) -> bool:
+        return True
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __repr__(self) -> str:
+        return f"<lazy {self._name} ({'loaded' if self.loaded else 'not loaded'})>"
+
+def _import_plotting(name: str):
+    import matplotlib
+    matplotlib.use("Agg")
+    return importlib.import_module(name)
+
+def lazy_import(name: str, plotting: bool = False) -> Lazy:
+    return Lazy(name, lambda: _import_plotting(name) if plotting else importlib.import_module(name))
+
+# heavy dependencies load on first use (or during the warm-up after on_ready)
+plt = lazy_import("matplotlib.pyplot", plotting=True)
+mdates = lazy_import("matplotlib.dates", plotting=True)
+mticker = lazy_import("matplotlib.ticker", plotting=True)
+mcollections = lazy_import("matplotlib.collections", plotting=True)
+mpf = lazy_import("mplfinance", plotting=True)
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+yf = lazy_import("yfinance")
+openai = lazy_import("openai")
+DDGS = Lazy("duckduckgo_search.DDGS", lambda: importlib.import_module("duckduckgo_search").DDGS)
+LAZY_MODULES = (plt, mdates, mticker, mcollections, pd, np, yf, openai, DDGS)
+
+def print_diagnostics():
+    print("=" * 50)
+    print("DISCORD BOT STARTING WITH MODERATION v2.1 - CACHE BUST")
+    print("=" * 50)
+    print(f"Environment check:")
+    print(f"- DISCORD_TOKEN present: {bool(os.getenv('DISCORD_TOKEN'))}")
+    print(f"- OPENAI_API_KEY present: {bool(os.getenv('OPENAI_API_KEY'))}")
+    if os.getenv('OPENAI_API_KEY'):
+        key = os.getenv('OPENAI_API_KEY')
+        print(f"- OPENAI_API_KEY length: {len(key)}")
+        print(f"- OPENAI_API_KEY starts with: {key[:10]}...")
+    else:
+        print("- OPENAI_API_KEY is None or empty")
+    print("=" * 50)
 
-print("=" * 50)
-print("DISCORD BOT STARTING WITH MODERATION v2.1 - CACHE BUST")
-print("=" * 50)
-print(f"Environment check:")
-print(f"- DISCORD_TOKEN present: {bool(os.getenv('DISCORD_TOKEN'))}")
-print(f"- OPENAI_API_KEY present: {bool(os.getenv('OPENAI_API_KEY'))}")
-if os.getenv('OPENAI_API_KEY'):
-    key = os.getenv('OPENAI_API_KEY')
-    print(f"- OPENAI_API_KEY length: {len(key)}")
-    print(f"- OPENAI_API_KEY starts with: {key[:10]}...")
-else:
-    print("- OPENAI_API_KEY is None or empty")
-print("=" * 50)
-
-try:  # optional candlestick support
-    import mplfinance as mpf
-    USE_CANDLES = True
+def rss_mb(pid: int | None = None) -> float:
+    """Resident set size of this process (or ``pid``) in MB (own peak RSS where /proc is unavailable)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        if pid:
+            return 0.0
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        return 0.0
+
+try:  # optional perceptual hashing for image moderation cache
+    from PIL import Image
 except Exception:  # pragma: no cover - best effort
-    mpf = None
-    USE_CANDLES = False
+    Image = None
+
+# optional candlestick support (checked without importing it)
+USE_CANDLES = importlib.util.find_spec("mplfinance") is not None
 
 
 TOKEN = os.getenv("DISCORD_TOKEN", "").strip()
@@ -52,6 +145,63 @@ PIPED_FRONTEND_BASE = os.getenv("PIPED_FRONTEND_BASE", "https://piped.video").rs
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "").strip()
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID", "").strip()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
+DATA_DIR = os.getenv("DATA_DIR", "data").strip() or "."
+MODERATION_MODEL = "omni-moderation-latest"
+MODERATION_BATCH_WINDOW_MS = float(os.getenv("MODERATION_BATCH_WINDOW_MS", "75") or 75)
+MODERATION_BATCH_MAX = int(os.getenv("MODERATION_BATCH_MAX", "32") or 32)
+MODERATION_CACHE_SIZE = int(os.getenv("MODERATION_CACHE_SIZE", "10000") or 10000)
+MODERATION_CACHE_TTL = float(os.getenv("MODERATION_CACHE_TTL", "3600") or 3600)
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "5000") or 5000)
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "86400") or 86400)
+IMAGE_FINGERPRINT_MAX_BYTES = int(os.getenv("IMAGE_FINGERPRINT_MAX_BYTES", str(8 * 1024 * 1024)) or 0)
+IMAGE_PHASH = os.getenv("IMAGE_PHASH", "0").strip().lower() not in ("0", "false", "no", "")
+IMAGE_PHASH_DISTANCE = int(os.getenv("IMAGE_PHASH_DISTANCE", "4") or 0)
+MODERATION_BLOCKLIST = [t.strip() for t in os.getenv("MODERATION_BLOCKLIST", "").split(",") if t.strip()]
+MODERATION_BLOCKLIST_FILE = os.getenv("MODERATION_BLOCKLIST_FILE", "").strip()
+MODERATION_ALLOWED_DOMAINS = [d.strip().lower() for d in os.getenv(
+    "MODERATION_ALLOWED_DOMAINS", "tenor.com,giphy.com,youtube.com,youtu.be,github.com,wikipedia.org"
+).split(",") if d.strip()]
+MODERATION_TRUSTED_ROLE_IDS = {int(x) for x in os.getenv("MODERATION_TRUSTED_ROLE_IDS", "").split(",") if x.strip().isdigit()}
+MODERATION_SKIP_CHANNEL_IDS = {int(x) for x in os.getenv("MODERATION_SKIP_CHANNEL_IDS", "").split(",") if x.strip().isdigit()}
+MODERATION_SAFE_WORD_MAX = int(os.getenv("MODERATION_SAFE_WORD_MAX", "0") or 0)  # needs a blocklist
+WARNING_POOL_PATH = os.getenv("WARNING_POOL_PATH", os.path.join(DATA_DIR, "warning_pool.json"))
+WARNING_POOL_VARIANTS = int(os.getenv("WARNING_POOL_VARIANTS", "5") or 5)
+WARNING_POOL_REFRESH_HOURS = float(os.getenv("WARNING_POOL_REFRESH_HOURS", "24") or 24)
+MODERATION_QUEUE_MAX = int(os.getenv("MODERATION_QUEUE_MAX", "500") or 500)
+# each worker holds one message until its verdict is back, so this also caps how many texts can
+# share a batch; the default keeps two full batches in flight
+MODERATION_WORKERS = int(os.getenv("MODERATION_WORKERS", str(2 * MODERATION_BATCH_MAX)) or 2 * MODERATION_BATCH_MAX)
+MODERATION_SHED_POLICY = os.getenv("MODERATION_SHED_POLICY", "local").strip().lower()  # sample, local or drop
+MODERATION_SHED_AT = float(os.getenv("MODERATION_SHED_AT", "0.8") or 0.8)  # fraction of the queue
+MODERATION_SHED_SAMPLE = float(os.getenv("MODERATION_SHED_SAMPLE", "0.2") or 0.0)
+NEW_ACCOUNT_DAYS = int(os.getenv("NEW_ACCOUNT_DAYS", "7") or 0)
+BURST_WINDOW_SEC = float(os.getenv("BURST_WINDOW_SEC", "10") or 0)
+BURST_FLUSH_DELAY = float(os.getenv("BURST_FLUSH_DELAY", "2") or 0)
+PURGE_JOBS_PATH = os.getenv("PURGE_JOBS_PATH", os.path.join(DATA_DIR, "purge_jobs.json"))
+PURGE_MAX_ACTIVE_JOBS = int(os.getenv("PURGE_MAX_ACTIVE_JOBS", "2") or 2)
+PURGE_CALLS_PER_SEC = float(os.getenv("PURGE_CALLS_PER_SEC", "0") or 0)  # 0: paced by Discord's rate-limit headers only
+STOCK_CACHE_MAX_BYTES = int(os.getenv("STOCK_CACHE_MAX_BYTES", str(64 * 1024 * 1024)) or 0)
+STOCK_INTRADAY_TTL = float(os.getenv("STOCK_INTRADAY_TTL", "60") or 60)
+STOCK_DAILY_TTL_OPEN = float(os.getenv("STOCK_DAILY_TTL_OPEN", "900") or 900)
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(32 * 1024 * 1024)) or 0)
+COMPARE_MAX_SYMBOLS = int(os.getenv("COMPARE_MAX_SYMBOLS", "10") or 10)
+WATCHLIST_PATH = os.getenv("WATCHLIST_PATH", os.path.join(DATA_DIR, "watchlists.json"))
+LIVE_TICK_SEC = float(os.getenv("LIVE_TICK_SEC", "60") or 60)
+LIVE_MINUTES = min(14.0, float(os.getenv("LIVE_MINUTES", "10") or 10))  # interaction tokens last 15 minutes
+LIVE_MAX_SUBSCRIPTIONS = int(os.getenv("LIVE_MAX_SUBSCRIPTIONS", "50") or 50)
+LIVE_MAX_PER_USER = int(os.getenv("LIVE_MAX_PER_USER", "2") or 2)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1").strip().lower() not in ("0", "false", "no", "")
+CHART_TEMPLATES_MAX = int(os.getenv("CHART_TEMPLATES_MAX", "4") or 4)
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", str(min(4, os.cpu_count() or 1))) or 0)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64") or 64)
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8") or 8)
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300") or 300)
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60") or 60)
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2") or 0)
+HTTP_BREAKER_FAILURES = int(os.getenv("HTTP_BREAKER_FAILURES", "5") or 5)
+HTTP_BREAKER_COOLDOWN = float(os.getenv("HTTP_BREAKER_COOLDOWN", "30") or 30)
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(8 * 1024 * 1024)) or 0)
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8") or 8)
 LAVENDER = 0xB57EDC
 
 intents = discord.Intents.default()
@@ -59,30 +209,32 @@ intents.guilds = True
 intents.message_content = True
 client = commands.Bot(command_prefix="!", intents=intents)
 
-# Initialize OpenAI client
-openai_client = None
-if OPENAI_API_KEY:
+# Initialize OpenAI client: one async client sharing a keep-alive connection pool
+openai_limiter = asyncio.Semaphore(max(1, OPENAI_MAX_CONCURRENCY))
+
+def build_openai_client() -> openai.AsyncOpenAI:
+    import httpx
     try:
-        # Initialize with minimal parameters to avoid conflicts
-        openai_client = openai.OpenAI(
+        client_ = openai.AsyncOpenAI(
             api_key=OPENAI_API_KEY,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max(1, OPENAI_MAX_CONCURRENCY),
+                    max_keepalive_connections=max(1, OPENAI_MAX_CONCURRENCY),
+                    keepalive_expiry=60.0,
+                ),
+            ),
         )
-        print("OpenAI client initialized successfully")
     except Exception as e:
         print(f"Failed to initialize OpenAI client: {e}")
-        # Try alternative initialization
-        try:
-            print("Trying alternative OpenAI client initialization...")
-            import openai as openai_lib
-            openai_lib.api_key = OPENAI_API_KEY
-            openai_client = openai_lib
-            print("OpenAI legacy client initialized successfully")
-        except Exception as e2:
-            print(f"Alternative initialization also failed: {e2}")
-            openai_client = None
+        raise
+    print("OpenAI client initialized successfully")
+    return client_
+
+# the client (and the openai package) is only built when moderation first needs it
+openai_client: openai.AsyncOpenAI | None = Lazy("openai client", build_openai_client) if OPENAI_API_KEY else None
 tree = client.tree
 
-_http: aiohttp.ClientSession | None = None
 DEFAULT_HEADERS = {"User-Agent": "homelab-discord-bot/1.0 (+github.com/you)"}
 
 def now_utc_iso():
@@ -108,57 +260,813 @@ async def reply_embed(inter: discord.Interaction, title: str, desc: str, *, ephe
     else:
         await inter.response.send_message(embed=emb(title, desc), ephemeral=ephemeral)
 
+class CircuitBreaker:
+    """Per-host breaker: after ``threshold`` straight failures, fail fast for ``cooldown`` seconds.
+
+    Once the cooldown passes a single trial request is let through (half-open);
+    its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self._trial = False
+
+    def release(self):
+        """End a trial that produced no verdict (e.g. it was cancelled) so another may run."""
+        self._trial = False
+
+    def failure(self) -> bool:
+        """Record a failure; True when this one opened the breaker."""
+        self.failures += 1
+        self._trial = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+class CachedResponse:
+    """Decoded JSON body of one GET plus the validators needed to revalidate it."""
+
+    __slots__ = ("data", "etag", "last_modified", "fresh_until", "size")
+
+    def __init__(self, data, headers, ttl: float, size: int):
+        self.data = data
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+        self.fresh_until = time.monotonic() + ttl
+        self.size = size
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.fresh_until
+
+    @property
+    def validators(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+class HttpClient:
+    """Shared aiohttp session for the JSON APIs behind the utility commands.
+
+    The connector caps connections overall and per host, caches DNS and keeps
+    connections alive between commands. Every request carries its own timeout;
+    idempotent GETs retry transient failures (timeouts, connection errors, 429
+    and 5xx) with jittered exponential backoff, and each host has a
+    CircuitBreaker so a dead upstream fails in milliseconds instead of holding
+    an interaction for the full timeout.
+
+    Responses from endpoints listed in ``cache_ttls`` (``host/path`` prefixes,
+    longest match wins) are kept in a byte-bounded LRU and answered locally
+    while fresh. Expired entries that carry an ETag or Last-Modified stay around
+    for ``STALE_FACTOR`` more TTLs and are revalidated with a conditional GET;
+    a 304 makes them fresh again without re-downloading the body.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    STALE_FACTOR = 4
+
+    def __init__(self, *, limit: int, limit_per_host: int, dns_ttl: int, keepalive: float,
+                 retries: int, breaker_failures: int, breaker_cooldown: float,
+                 cache_bytes: int = 0, cache_ttls: dict[str, float] | None = None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.retries = max(0, retries)
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.cache = TTLCache(cache_bytes, 0, sizeof=lambda entry: entry.size) if cache_bytes > 0 else None
+        self.cache_ttls = sorted((cache_ttls or {}).items(), key=lambda kv: len(kv[0]), reverse=True)
+        self.revalidated = 0
+        self._session: aiohttp.ClientSession | None = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS)
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(self.breaker_failures, self.breaker_cooldown)
+        return breaker
+
+    def cache_ttl(self, url: str) -> float:
+        """Freshness lifetime configured for ``url``; 0 when it is not cached."""
+        parts = urlsplit(url)
+        target = f"{parts.hostname}{parts.path}"
+        for prefix, ttl in self.cache_ttls:
+            if target.startswith(prefix):
+                return ttl
+        return 0.0
+
+    async def get_json(self, url: str, params: dict | None = None, timeout_sec: float = 10.0,
+                       retries: int | None = None, headers: dict | None = None):
+        ttl = self.cache_ttl(url) if self.cache is not None and not headers else 0.0
+        if ttl <= 0:
+            return (await self.fetch(url, params, timeout_sec, retries, headers))[1]
+        key = (url, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            return entry.data
+        status, data, resp_headers, size = await self.fetch(
+            url, params, timeout_sec, retries, entry.validators if entry else None
+        )
+        if status == 304 and entry is not None:
+            self.revalidated += 1
+            entry.fresh_until = time.monotonic() + ttl
+        else:
+            if "no-store" in resp_headers.get("Cache-Control", ""):
+                return data
+            entry = CachedResponse(data, resp_headers, ttl, size)
+        keep = ttl * self.STALE_FACTOR if entry.etag or entry.last_modified else ttl
+        self.cache.set(key, entry, ttl=keep)
+        return entry.data
+
+    async def fetch(self, url: str, params: dict | None = None, timeout_sec: float = 10.0,
+                    retries: int | None = None, headers: dict | None = None):
+        """GET ``url`` and return ``(status, json, headers, body bytes)``; status is 200 or 304."""
+        host = urlsplit(url).hostname or url
+        breaker = self.breaker(host)
+        retries = self.retries if retries is None else retries
+        timeout = aiohttp.ClientTimeout(total=timeout_sec, connect=min(timeout_sec, 5.0))
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                raise RuntimeError(f"{host} is unavailable right now")
+            trial = breaker.state != "closed"
+            retry_after = None
+            try:
+                async with self.session().get(url, params=params, timeout=timeout, headers=headers) as r:
+                    if r.status == 200:
+                        body = await r.read()
+                        data = await r.json()
+                        breaker.success()
+                        return r.status, data, r.headers, len(body)
+                    if r.status == 304 and headers:
+                        breaker.success()
+                        return r.status, None, r.headers, 0
+                    if r.status not in self.RETRY_STATUSES:
+                        breaker.success()  # the upstream answered; the request was bad
+                        raise RuntimeError(f"HTTP {r.status}")
+                    error = RuntimeError(f"HTTP {r.status}")
+                    retry_after = r.headers.get("Retry-After")
+            except asyncio.TimeoutError:
+                error = RuntimeError("timeout")
+            except aiohttp.ContentTypeError as e:
+                breaker.success()
+                raise RuntimeError(str(e) or "client error")
+            except ValueError:
+                breaker.success()
+                raise RuntimeError("invalid JSON response")
+            except aiohttp.ClientError as e:
+                error = RuntimeError(str(e) or "client error")
+            finally:
+                if trial:
+                    breaker.release()
+            if breaker.failure():
+                print(f"HTTP circuit for {host} opened for {self.breaker_cooldown:.0f}s: {error}")
+            if attempt == retries:
+                raise error
+            delay = 0.25 * 2**attempt * random.uniform(0.5, 1.5)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), timeout_sec))
+            await asyncio.sleep(delay)
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after a TTL; counts hits and misses.
+
+    ``maxsize`` counts entries, or whatever unit ``sizeof`` returns (e.g. bytes).
+    Safe to share between the event loop and worker threads.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, *, sizeof=None):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value, size)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: float | None = None):
+        size = self.sizeof(value) if self.sizeof else 1
+        with self._lock:
+            self._discard(key)
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, size)
+            self.size += size
+            while self.size > self.maxsize and len(self._data) > 1:
+                self._discard(next(iter(self._data)))
+
+    def _discard(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        usage = f"{len(self)} entries, {self.size / 1e6:.1f}/{self.maxsize / 1e6:.1f} MB" if self.sizeof else f"{len(self)}/{self.maxsize} entries"
+        return f"{usage} • {self.hits} hits / {self.misses} misses ({rate:.1f}% hit rate)"
+
+
+# Freshness per endpoint (host + path prefix). Anything not listed is never cached.
+HTTP_CACHE_TTLS = {
+    "api.dictionaryapi.dev/api/v2/entries/": 7 * 86400,
+    "en.wikipedia.org/w/api.php": 6 * 3600,
+    "en.wikipedia.org/api/rest_v1/page/summary/": 6 * 3600,
+    "geocoding-api.open-meteo.com/v1/search": 86400,
+    "api.open-meteo.com/v1/forecast": 10 * 60,
+    f"{urlsplit(PIPED_API_BASE).hostname}{urlsplit(PIPED_API_BASE).path}/search": 30 * 60,
+}
+
+http_client = HttpClient(
+    limit=HTTP_MAX_CONNECTIONS,
+    limit_per_host=HTTP_MAX_PER_HOST,
+    dns_ttl=HTTP_DNS_TTL,
+    keepalive=HTTP_KEEPALIVE,
+    retries=HTTP_RETRIES,
+    breaker_failures=HTTP_BREAKER_FAILURES,
+    breaker_cooldown=HTTP_BREAKER_COOLDOWN,
+    cache_bytes=HTTP_CACHE_MAX_BYTES,
+    cache_ttls=HTTP_CACHE_TTLS,
+)
+
+def http_session() -> aiohttp.ClientSession:
+    return http_client.session()
+
 async def http_get_json(url: str, params: dict | None = None, timeout_sec: float = 10.0):
-    global _http
-    params = params or {}
-    if _http is None or _http.closed:
-        _http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout_sec), headers=DEFAULT_HEADERS)
+    return await http_client.get_json(url, params or {}, timeout_sec)
+
+
+class ModerationVerdict:
+    """Flagged status, flagged categories and category scores of one moderated input."""
+
+    __slots__ = ("flagged", "categories", "scores")
+
+    def __init__(self, flagged: bool, categories: list[str], scores: dict | None = None):
+        self.flagged = flagged
+        self.categories = categories
+        self.scores = scores or {}
+
+    @classmethod
+    def from_result(cls, result) -> "ModerationVerdict":
+        categories = [cat for cat, flagged in result.categories.model_dump().items() if flagged]
+        return cls(bool(result.flagged), categories, result.category_scores.model_dump())
+
+
+def content_key(text: str) -> bytes:
+    """Hash of case- and whitespace-normalized text, used as the moderation cache key."""
+    return hashlib.sha256(" ".join(text.casefold().split()).encode()).digest()
+
+
+class PerceptualHashCache(TTLCache):
+    """TTLCache keyed by 64-bit perceptual hashes that also matches near-identical hashes."""
+
+    def get_near(self, phash: int, max_distance: int, default=None):
+        with self._lock:
+            if phash in self._data:
+                return self.get(phash, default)
+            now = time.monotonic()
+            for key, (expires_at, _value, _size) in self._data.items():
+                if expires_at > now and (key ^ phash).bit_count() <= max_distance:
+                    return self.get(key, default)
+            self.misses += 1
+            return default
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+moderation_cache = TTLCache(MODERATION_CACHE_SIZE, MODERATION_CACHE_TTL)
+image_cache = TTLCache(IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL)
+image_phash_cache = PerceptualHashCache(IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL)
+# perceptual matches are only hints: an 8x8 hash can't tell two captions on one meme template apart
+phash_stats = {"hints": 0, "agreed": 0}
+
+
+def image_content_key(attachment: discord.Attachment, data: bytes) -> str:
+    """Exact fingerprint: attachment metadata plus a hash of the downloaded bytes."""
+    return f"{attachment.size}:{attachment.width}x{attachment.height}:{hashlib.sha256(data).hexdigest()}"
+
+
+def image_perceptual_key(data: bytes) -> int | None:
+    """64-bit difference hash, stable across re-encoding and resizing; None without Pillow."""
+    if Image is None or not IMAGE_PHASH:
+        return None
     try:
-        async with _http.get(url, params=params) as r:
-            if r.status != 200:
-                raise RuntimeError(f"HTTP {r.status}")
-            return await r.json()
-    except asyncio.TimeoutError:
-        raise RuntimeError("timeout")
-    except aiohttp.ClientError as e:
-        raise RuntimeError(str(e) or "client error")
-
-async def moderate_text(text: str) -> dict | None:
-    """Moderate text content using OpenAI's moderation API."""
+        with Image.open(io.BytesIO(data)) as im:
+            px = list(im.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton: finds any of many terms in a single pass over the text.
+
+    Matches are case-insensitive and only count on word boundaries, so a
+    blocked "ass" doesn't fire on "class".
+    """
+
+    def __init__(self, terms: list[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[str]] = [[]]
+        for term in {t.casefold() for t in terms if t.strip()}:
+            node = 0
+            for ch in term:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(term)
+        # breadth-first pass to wire failure links
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, nxt in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0) if node else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def find(self, text: str) -> str | None:
+        text = text.casefold()
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for term in self._out[node]:
+                start, end = i - len(term) + 1, i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    return term
+        return None
+
+
+def load_blocklist() -> list[str]:
+    terms = list(MODERATION_BLOCKLIST)
+    if MODERATION_BLOCKLIST_FILE:
+        try:
+            with open(MODERATION_BLOCKLIST_FILE, encoding="utf-8") as f:
+                terms += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        except OSError as e:
+            print(f"Could not read moderation blocklist {MODERATION_BLOCKLIST_FILE}: {e}")
+    return terms
+
+
+blocklist_matcher = KeywordMatcher(load_blocklist())
+prefilter_stats = {"trusted": 0, "blocked": 0, "allowed": 0, "saved": 0}
+
+DISCORD_TOKEN_RE = re.compile(r"<a?:\w+:\d+>|<[@#][!&]?\d+>")
+URL_RE = re.compile(r"https?://([^/\s:?#]+)\S*", re.IGNORECASE)
+SINGLE_WORD_RE = re.compile(rf"[^\W_]{{1,{max(1, MODERATION_SAFE_WORD_MAX)}}}[!?.]*")
+
+
+def prefilter_trusted(message: discord.Message) -> bool:
+    """Messages in skipped channels or from trusted roles are never moderated."""
+    if message.channel.id in MODERATION_SKIP_CHANNEL_IDS:
+        return True
+    roles = getattr(message.author, "roles", None) or []
+    return any(role.id in MODERATION_TRUSTED_ROLE_IDS for role in roles)
+
+
+def prefilter_text(text: str) -> ModerationVerdict | None:
+    """Decide trivially bad or trivially safe text locally; None means ask the API."""
+    term = blocklist_matcher.find(text) if blocklist_matcher else None
+    if term:
+        return ModerationVerdict(True, ["blocklist"])
+    stripped = DISCORD_TOKEN_RE.sub(" ", text).strip()
+    # emoji, punctuation and mentions only
+    if not any(ch.isalnum() for ch in stripped):
+        return ModerationVerdict(False, [])
+    # a lone word is only trusted when the blocklist has already screened it
+    if MODERATION_SAFE_WORD_MAX and blocklist_matcher and SINGLE_WORD_RE.fullmatch(stripped):
+        return ModerationVerdict(False, [])
+    hosts = [h.lower() for h in URL_RE.findall(stripped)]
+    if hosts and not any(ch.isalnum() for ch in URL_RE.sub(" ", stripped)):
+        if all(any(h == d or h.endswith("." + d) for d in MODERATION_ALLOWED_DOMAINS) for h in hosts):
+            return ModerationVerdict(False, [])
+    return None
+
+
+class ModerationBatcher:
+    """Collect texts over a short window and moderate them in one list-input request."""
+
+    def __init__(self, window_sec: float, max_batch: int):
+        self.window_sec = window_sec
+        self.max_batch = max(1, max_batch)
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.Task | None = None
+
+    async def submit(self, text: str):
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_after_window())
+        return await fut
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window_sec)
+        self._timer = None
+        self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.create_task(self._send(batch))
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]):
+        # identical texts (copypasta) only need to be sent once per batch
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            async with openai_limiter:
+                response = await openai_client.moderations.create(
+                    input=unique,
+                    model=MODERATION_MODEL
+                )
+            by_text = dict(zip(unique, response.results or []))
+        except Exception as e:
+            print(f"Text moderation error ({len(unique)} inputs): {e}")
+            by_text = {}
+        for text, fut in batch:
+            if not fut.done():
+                fut.set_result(by_text.get(text))
+
+moderation_batcher = ModerationBatcher(MODERATION_BATCH_WINDOW_MS / 1000, MODERATION_BATCH_MAX)
+
+async def moderate_text(text: str) -> ModerationVerdict | None:
+    """Moderate text content using OpenAI's moderation API (cached, batched with concurrent calls)."""
     if not openai_client or not text.strip():
         return None
-    
-    try:
-        response = await asyncio.to_thread(
-            openai_client.moderations.create,
-            input=text,
-            model="omni-moderation-latest"
-        )
-        return response.results[0] if response.results else None
-    except Exception as e:
-        print(f"Text moderation error: {e}")
+    key = content_key(text)
+    verdict = moderation_cache.get(key)
+    if verdict is not None:
+        return verdict
+    result = await moderation_batcher.submit(text)
+    if result is None:
         return None
+    verdict = ModerationVerdict.from_result(result)
+    moderation_cache.set(key, verdict)
+    return verdict
 
-async def moderate_image(image_url: str) -> dict | None:
+async def moderate_image(image_url: str) -> ModerationVerdict | None:
     """Moderate image content using OpenAI's moderation API."""
     if not openai_client or not image_url:
         return None
     
     try:
-        response = await asyncio.to_thread(
-            openai_client.moderations.create,
-            input=[{"type": "image_url", "image_url": {"url": image_url}}],
-            model="omni-moderation-latest"
-        )
-        return response.results[0] if response.results else None
+        async with openai_limiter:
+            response = await openai_client.moderations.create(
+                input=[{"type": "image_url", "image_url": {"url": image_url}}],
+                model=MODERATION_MODEL
+            )
+        return ModerationVerdict.from_result(response.results[0]) if response.results else None
     except Exception as e:
         print(f"Image moderation error: {e}")
         return None
 
-async def generate_personalized_warning(flagged_categories: list) -> str:
-    """Generate a personalized warning message based on flagged categories using AI."""
+async def fingerprint_attachment(attachment: discord.Attachment) -> tuple[ModerationVerdict | None, str | None, int | None]:
+    """Look an image attachment up by its exact fingerprint; returns (verdict, exact key, perceptual hash).
+
+    Only an exact match reuses a verdict. The perceptual hash (IMAGE_PHASH) is
+    returned so remember_attachment can record how often a near match would
+    have agreed with the API.
+    """
+    if IMAGE_FINGERPRINT_MAX_BYTES and attachment.size > IMAGE_FINGERPRINT_MAX_BYTES:
+        return None, None, None
+    try:
+        data = await attachment.read()
+    except discord.HTTPException:
+        return None, None, None
+
+    exact = image_content_key(attachment, data)
+    verdict = image_cache.get(exact)
+    if verdict is not None:
+        return verdict, exact, None
+    perceptual = await asyncio.to_thread(image_perceptual_key, data) if IMAGE_PHASH else None
+    return None, exact, perceptual
+
+def remember_attachment(exact: str | None, perceptual: int | None, verdict: ModerationVerdict):
+    if exact:
+        image_cache.set(exact, verdict)
+    if perceptual is not None:
+        hint = image_phash_cache.get_near(perceptual, IMAGE_PHASH_DISTANCE)
+        if hint is not None:
+            phash_stats["hints"] += 1
+            phash_stats["agreed"] += hint.flagged == verdict.flagged
+        image_phash_cache.set(perceptual, verdict)
+
+async def moderate_attachment(attachment: discord.Attachment) -> ModerationVerdict | None:
+    """Moderate an image attachment, reusing verdicts for images we've already seen."""
+    if not openai_client:
+        return None
+    verdict, exact, perceptual = await fingerprint_attachment(attachment)
+    if verdict is None:
+        verdict = await moderate_image(attachment.url)
+        if verdict is not None:
+            remember_attachment(exact, perceptual, verdict)
+    return verdict
+
+async def moderate_inputs(inputs: list[dict]) -> tuple[list[ModerationVerdict | None], bool]:
+    """Moderate several multimodal inputs in one request.
+
+    Returns one verdict per input, and whether those verdicts are truly per input.
+    When the API answers a multimodal array with a single combined result, each
+    input gets the flagged categories that applied to its input type instead.
+    """
+    async with openai_limiter:
+        response = await openai_client.moderations.create(input=inputs, model=MODERATION_MODEL)
+    results = response.results or []
+    if len(results) == len(inputs):
+        return [ModerationVerdict.from_result(r) for r in results], True
+    if not results:
+        return [None] * len(inputs), True
+
+    combined = ModerationVerdict.from_result(results[0])
+    applied = getattr(results[0], "category_applied_input_types", None)
+    applied = applied.model_dump() if applied is not None else {}
+    verdicts = []
+    for item in inputs:
+        kind = "text" if item["type"] == "text" else "image"
+        categories = [cat for cat in combined.categories if kind in (applied.get(cat) or [kind])]
+        verdicts.append(ModerationVerdict(bool(categories), categories, combined.scores))
+    return verdicts, False
+
+async def moderate_message(message: discord.Message):
+    """Moderate a message's text and image attachments in at most one API round trip.
+
+    Cached text and image verdicts are reused; only the remaining inputs are sent,
+    together, in one multimodal request. Text-only messages go through the batcher.
+    The first flagged item (text, then images in order) is acted on. The local
+    pre-filter runs first and settles trusted, blocked and trivially safe text.
+    """
+    text = message.content if message.content.strip() else ""
+    images = [a for a in message.attachments if a.filename.lower().endswith(IMAGE_EXTENSIONS)]
+    if prefilter_trusted(message):
+        prefilter_stats["trusted"] += 1
+        prefilter_stats["saved"] += 1
+        return
+    local = prefilter_text(text) if text else None
+    if local is not None:
+        if local.flagged:
+            prefilter_stats["blocked"] += 1
+            prefilter_stats["saved"] += 1
+            await handle_moderation_result(message, local, "message")
+            return
+        prefilter_stats["allowed"] += 1
+        text = ""
+        if not images:
+            prefilter_stats["saved"] += 1
+            return
+    if not images:
+        verdict = await moderate_text(text) if text else None
+        if verdict and verdict.flagged:
+            await handle_moderation_result(message, verdict, "message")
+        return
+
+    text_key = content_key(text) if text else None
+    verdicts: list[ModerationVerdict | None] = [moderation_cache.get(text_key) if text else None]
+    if verdicts[0] and verdicts[0].flagged:
+        # already known to violate: no need to download or submit the images
+        await handle_moderation_result(message, verdicts[0], "message")
+        return
+    lookups = await asyncio.gather(*(fingerprint_attachment(a) for a in images))
+    verdicts += [verdict for verdict, _, _ in lookups]
+
+    inputs, slots = [], []
+    if text and verdicts[0] is None:
+        inputs.append({"type": "text", "text": text})
+        slots.append(0)
+    for i, attachment in enumerate(images, 1):
+        if verdicts[i] is None:
+            inputs.append({"type": "image_url", "image_url": {"url": attachment.url}})
+            slots.append(i)
+
+    if inputs:
+        try:
+            fresh, per_input = await moderate_inputs(inputs)
+        except Exception as e:
+            # fall back to one request per item rather than leaving the message unchecked
+            print(f"Combined moderation error ({len(inputs)} inputs), retrying per item: {e}")
+            fresh = await asyncio.gather(*(
+                moderate_text(text) if slot == 0 else moderate_attachment(images[slot - 1]) for slot in slots
+            ))
+            per_input = True
+        image_inputs = sum(1 for slot in slots if slot)
+        for slot, verdict in zip(slots, fresh):
+            verdicts[slot] = verdict
+            if verdict is None:
+                continue
+            if slot == 0:
+                moderation_cache.set(text_key, verdict)
+            elif per_input or image_inputs == 1 or not verdict.flagged:
+                _, exact, perceptual = lookups[slot - 1]
+                remember_attachment(exact, perceptual, verdict)
+
+    for slot, verdict in enumerate(verdicts):
+        if verdict and verdict.flagged:
+            await handle_moderation_result(message, verdict, "message" if slot == 0 else "image")
+            return
+
+async def moderate_message_locally(message: discord.Message):
+    """Pre-filter-only moderation, used for messages shed from a saturated queue."""
+    if prefilter_trusted(message) or not message.content.strip():
+        return
+    local = prefilter_text(message.content)
+    if local is not None and local.flagged:
+        prefilter_stats["blocked"] += 1
+        await handle_moderation_result(message, local, "message")
+
+def is_new_account(author) -> bool:
+    if not NEW_ACCOUNT_DAYS:
+        return False
+    cutoff = discord.utils.utcnow() - dt.timedelta(days=NEW_ACCOUNT_DAYS)
+    joined = getattr(author, "joined_at", None)
+    return author.created_at > cutoff or bool(joined and joined > cutoff)
+
+class ModerationQueue:
+    """Bounded priority queue of messages awaiting moderation, drained by a fixed worker pool.
+
+    Workers wait for each verdict, so at most ``workers`` texts are ever pending
+    in the ModerationBatcher: with fewer workers than MODERATION_BATCH_MAX a
+    batch can never fill and every request carries only ``workers`` inputs.
+    Messages from new accounts are served first. Past the shedding watermark,
+    other messages are handled by MODERATION_SHED_POLICY:
+    "local" runs only the local pre-filter on them, "sample" still queues a
+    random fraction and pre-filters the rest, and "drop" skips them.
+    """
+
+    def __init__(self, maxsize: int, workers: int, policy: str, shed_at: float, sample_rate: float):
+        self.maxsize = max(1, maxsize)
+        self.workers = max(1, workers)
+        self.policy = policy if policy in ("sample", "local", "drop") else "local"
+        self.shed_at = max(1, int(self.maxsize * min(max(shed_at, 0.0), 1.0)))
+        self.sample_rate = sample_rate
+        self.stats = {"processed": 0, "sampled": 0, "local": 0, "dropped": 0}
+        self.wait_avg = 0.0
+        self.wait_max = 0.0
+        self._queue: asyncio.PriorityQueue | None = None
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue(self.maxsize)
+        if self.workers < MODERATION_BATCH_MAX:
+            print(f"MODERATION_WORKERS={self.workers} is below MODERATION_BATCH_MAX={MODERATION_BATCH_MAX}; "
+                  f"text batches will hold at most {self.workers} messages")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def submit(self, message: discord.Message):
+        if self._queue is None:
+            self.start()
+        priority = 0 if is_new_account(message.author) else 1
+        if self.depth() >= self.shed_at:
+            admit = priority == 0
+            if not admit and self.policy == "sample" and random.random() < self.sample_rate:
+                admit = True
+                self.stats["sampled"] += 1
+            if not admit or self._queue.full():
+                return self._shed(message)
+        self._queue.put_nowait((priority, next(self._seq), time.monotonic(), message))
+
+    def _shed(self, message: discord.Message):
+        if self.policy == "drop":
+            self.stats["dropped"] += 1
+            return
+        self.stats["local"] += 1
+        asyncio.create_task(moderate_message_locally(message))
+
+    async def _worker(self):
+        while True:
+            _priority, _seq, enqueued_at, message = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self.wait_avg = wait if not self.stats["processed"] else self.wait_avg * 0.9 + wait * 0.1
+            self.wait_max = max(self.wait_max, wait)
+            try:
+                await moderate_message(message)
+            except Exception as e:
+                print(f"Error moderating message: {e}")
+            finally:
+                self.stats["processed"] += 1
+                self._queue.task_done()
+
+    def describe(self) -> str:
+        return (
+            f"depth {self.depth()}/{self.maxsize} • {self.workers} workers • "
+            f"wait avg {self.wait_avg * 1000:.0f} ms, max {self.wait_max * 1000:.0f} ms • "
+            f"{self.stats['processed']} processed, {self.stats['local']} shed to local, "
+            f"{self.stats['sampled']} sampled, {self.stats['dropped']} dropped ({self.policy})"
+        )
+
+moderation_queue = ModerationQueue(
+    MODERATION_QUEUE_MAX, MODERATION_WORKERS, MODERATION_SHED_POLICY, MODERATION_SHED_AT, MODERATION_SHED_SAMPLE
+)
+
+DEFAULT_WARNING = "Let's keep this community positive and respectful! 🌟"
+MODERATION_CATEGORIES = (
+    "harassment", "harassment_threatening", "hate", "hate_threatening", "illicit", "illicit_violent",
+    "self_harm", "self_harm_instructions", "self_harm_intent", "sexual", "sexual_minors",
+    "violence", "violence_graphic",
+)
+
+def fallback_warning(flagged_categories: list) -> str:
+    """Static warning for when no generated one is available."""
+    fallbacks = {
+        "hate": "Be the bigger person! Spread kindness instead 💪",
+        "harassment": "Your words have power - use them to lift others up! ✨",
+        "violence": "Channel that energy into something positive! 🚀",
+        "self_harm": "You matter and you're not alone. Reach out for support! 🤗",
+        "sexual": "Let's keep things family-friendly here! 😊"
+    }
+    
+    # Return first matching fallback or default
+    for category in flagged_categories:
+        for prefix, text in fallbacks.items():
+            if category.startswith(prefix):
+                return text
+    
+    return DEFAULT_WARNING
+
+async def generate_personalized_warnings(flagged_categories: list, count: int = 1) -> list[str]:
+    """Generate personalized warning messages based on flagged categories using AI."""
     if not openai_client or not flagged_categories:
-        return "Let's keep this community positive and respectful! 🌟"
+        return []
     
     # Create a prompt based on the flagged categories
     categories_text = ", ".join(flagged_categories)
@@ -179,57 +1087,157 @@ Examples:
 Keep it under 100 characters and uplifting:"""
 
     try:
-        response = await asyncio.to_thread(
-            openai_client.chat.completions.create,
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=50,
-            temperature=0.7
-        )
-        
-        ai_message = response.choices[0].message.content.strip()
+        async with openai_limiter:
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=50,
+                temperature=0.9,
+                n=max(1, count)
+            )
+    except Exception as e:
+        print(f"Error generating AI warning messages for {categories_text}: {e}")
+        return []
+
+    messages = []
+    for choice in response.choices:
+        ai_message = (choice.message.content or "").strip().strip('"')
         # Ensure it's not too long
         if len(ai_message) > 100:
             ai_message = ai_message[:97] + "..."
-            
-        return ai_message
-    except Exception as e:
-        print(f"Error generating AI warning message: {e}")
-        # Fallback messages based on category
-        fallbacks = {
-            "hate": "Be the bigger person! Spread kindness instead 💪",
-            "harassment": "Your words have power - use them to lift others up! ✨",
-            "violence": "Channel that energy into something positive! 🚀",
-            "self-harm": "You matter and you're not alone. Reach out for support! 🤗",
-            "sexual": "Let's keep things family-friendly here! 😊"
-        }
-        
-        # Return first matching fallback or default
-        for category in flagged_categories:
-            if category in fallbacks:
-                return fallbacks[category]
-        
-        return "Let's keep this community positive and respectful! 🌟"
+        if ai_message:
+            messages.append(ai_message)
+    return messages
+
+class WarningPool:
+    """Pre-generated warning messages per flagged-category combination.
+
+    Picking is a dict lookup plus random.choice; generation happens in the
+    background. Combinations seen for the first time are answered from the
+    single-category pools (or the static fallbacks) and queued for generation.
+    The pool is saved to disk so it survives restarts.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pools: dict[str, list[str]] = {}
+        self.refreshed_at = 0.0
+        self._wanted: set[str] = set()
+
+    @staticmethod
+    def key(flagged_categories: list) -> str:
+        return ",".join(sorted(set(flagged_categories)))
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.pools = {k: list(v) for k, v in (data.get("pools") or {}).items() if v}
+            self.refreshed_at = float(data.get("refreshed_at") or 0.0)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not load warning pool from {self.path}: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"refreshed_at": self.refreshed_at, "pools": self.pools}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def pick(self, flagged_categories: list) -> str:
+        key = self.key(flagged_categories)
+        pool = self.pools.get(key)
+        if not pool:
+            if key and all(cat in MODERATION_CATEGORIES for cat in key.split(",")):
+                self._wanted.add(key)
+            pool = next((self.pools[cat] for cat in flagged_categories if self.pools.get(cat)), None)
+        return random.choice(pool) if pool else fallback_warning(flagged_categories)
+
+    async def fill(self, keys):
+        changed = False
+        for key in keys:
+            messages = await generate_personalized_warnings(key.split(","), WARNING_POOL_VARIANTS)
+            if messages:
+                self.pools[key] = messages
+                changed = True
+        if changed:
+            try:
+                await asyncio.to_thread(self.save)
+            except OSError as e:
+                print(f"Could not save warning pool to {self.path}: {e}")
 
-async def handle_moderation_result(message: discord.Message, result: dict, content_type: str = "content"):
-    """Handle moderation result by taking appropriate action."""
-    if not result or not result.flagged:
-        return
-    
-    # Get flagged categories
-    flagged_categories = [cat for cat, flagged in result.categories.model_dump().items() if flagged]
+    async def run(self, tick_sec: float = 60.0):
+        """Keep the pool filled: missing keys every tick, everything once per refresh period."""
+        while True:
+            try:
+                if time.time() - self.refreshed_at > WARNING_POOL_REFRESH_HOURS * 3600:
+                    keys = set(MODERATION_CATEGORIES) | set(self.pools) | self._wanted
+                    self._wanted.clear()
+                    self.refreshed_at = time.time()
+                    await self.fill(sorted(keys))
+                    print(f"Warning pool refreshed ({len(self.pools)} category combinations)")
+                elif self._wanted:
+                    keys, self._wanted = self._wanted, set()
+                    await self.fill(sorted(keys))
+            except Exception as e:
+                print(f"Warning pool refresh error: {e}")
+            await asyncio.sleep(tick_sec)
+
+warning_pool = WarningPool(WARNING_POOL_PATH)
+warning_pool.load()
+
+async def delete_flagged_messages(messages: list[discord.Message], reason: str) -> int:
+    """Delete messages with one bulk call per channel where possible; returns how many are gone."""
+    by_channel: dict[int, list[discord.Message]] = {}
+    for m in messages:
+        by_channel.setdefault(m.channel.id, []).append(m)
+    deleted = 0
+    for batch in by_channel.values():
+        for i in range(0, len(batch), 100):
+            chunk = batch[i:i + 100]
+            if len(chunk) > 1:
+                try:
+                    await chunk[0].channel.delete_messages(chunk, reason=reason)
+                    deleted += len(chunk)
+                    continue
+                except discord.Forbidden:
+                    raise
+                except discord.HTTPException:
+                    pass  # e.g. one of them is already gone; fall back to single deletes
+            for m in chunk:
+                try:
+                    await m.delete()
+                    deleted += 1
+                except discord.NotFound:
+                    # Message was already deleted
+                    pass
+    return deleted
+
+async def act_on_violations(violations: list[tuple[discord.Message, ModerationVerdict, str]]):
+    """Delete one user's flagged messages and send them a single warning."""
+    message = violations[-1][0]
+    flagged_categories = list(dict.fromkeys(cat for _, verdict, _ in violations for cat in verdict.categories))
+    content_type = violations[0][2]
     
     try:
-        # Delete the message
-        await message.delete()
+        # Delete the message(s)
+        deleted = await delete_flagged_messages([m for m, _, _ in violations], reason="AI moderation")
+        if not deleted:
+            return
         
-        # Generate personalized AI warning message
-        ai_message = await generate_personalized_warning(flagged_categories)
+        # Pick a pre-generated personalized warning message
+        ai_message = warning_pool.pick(flagged_categories)
         
         # Send a warning to the user
+        if len(violations) == 1:
+            description = f"Your {content_type} was removed for violating community guidelines."
+        else:
+            description = f"{deleted} of your messages were removed for violating community guidelines."
         warning_embed = discord.Embed(
             title="Content Moderated",
-            description=f"Your {content_type} was removed for violating community guidelines.",
+            description=description,
             color=0xFF0000
         )
         warning_embed.add_field(
@@ -249,25 +1257,71 @@ async def handle_moderation_result(message: discord.Message, result: dict, conte
         except discord.Forbidden:
             # If we can't DM the user, send to channel temporarily
             warning_msg = await message.channel.send(f"{message.author.mention}", embed=warning_embed)
-            # Delete the warning after 10 seconds
-            await asyncio.sleep(10)
-            try:
-                await warning_msg.delete()
-            except discord.NotFound:
-                pass
+            # Delete the warning after 10 seconds (in the background)
+            await warning_msg.delete(delay=10)
         
         # Log to console
-        print(f"Moderated {content_type} from {message.author} ({message.author.id}) in #{message.channel}: {flagged_categories}")
+        print(f"Moderated {deleted} {content_type}(s) from {message.author} ({message.author.id}) in #{message.channel}: {flagged_categories}")
         print(f"AI message: {ai_message}")
         
-    except discord.NotFound:
-        # Message was already deleted
-        pass
     except discord.Forbidden:
         print(f"Missing permissions to moderate message from {message.author} in #{message.channel}")
     except Exception as e:
         print(f"Error handling moderation result: {e}")
 
+class ViolationTracker:
+    """Per-user sliding window of violations, so a flood is handled as one burst.
+
+    A user's first violation in BURST_WINDOW_SEC is acted on immediately. Later
+    ones inside the window are held for BURST_FLUSH_DELAY seconds and then
+    deleted together (bulk delete per channel) with one summarizing warning.
+    """
+
+    def __init__(self, window_sec: float, flush_delay: float):
+        self.window_sec = window_sec
+        self.flush_delay = flush_delay
+        self.bursts = 0
+        self.coalesced = 0
+        self._recent: dict[int, deque] = {}
+        self._pending: dict[int, list[tuple[discord.Message, ModerationVerdict, str]]] = {}
+
+    def _in_burst(self, user_id: int) -> bool:
+        now = time.monotonic()
+        if len(self._recent) > 1000:
+            self._recent = {uid: q for uid, q in self._recent.items() if q and q[-1] > now - self.window_sec}
+        seen = self._recent.setdefault(user_id, deque())
+        while seen and seen[0] <= now - self.window_sec:
+            seen.popleft()
+        seen.append(now)
+        return len(seen) > 1
+
+    async def add(self, message: discord.Message, verdict: ModerationVerdict, content_type: str):
+        user_id = message.author.id
+        if not self.window_sec or not self._in_burst(user_id):
+            return await act_on_violations([(message, verdict, content_type)])
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            pending.append((message, verdict, content_type))
+            return
+        self._pending[user_id] = [(message, verdict, content_type)]
+        asyncio.create_task(self._flush_later(user_id))
+
+    async def _flush_later(self, user_id: int):
+        await asyncio.sleep(self.flush_delay)
+        batch = self._pending.pop(user_id, [])
+        if batch:
+            self.bursts += 1
+            self.coalesced += len(batch)
+            await act_on_violations(batch)
+
+violation_tracker = ViolationTracker(BURST_WINDOW_SEC, BURST_FLUSH_DELAY)
+
+async def handle_moderation_result(message: discord.Message, result: ModerationVerdict, content_type: str = "content"):
+    """Handle moderation result by taking appropriate action."""
+    if not result or not result.flagged:
+        return
+    await violation_tracker.add(message, result, content_type)
+
 def hhmmss(seconds: int | None) -> str:
     if seconds is None:
         return "—"
@@ -329,8 +1383,101 @@ async def send_role_picker_embed():
     e.set_footer(text=f"Last posted {now_utc_iso()}")
     await ch.send(embed=e, view=RolePicker())
 
+WARMUP_HOSTS = (
+    "https://en.wikipedia.org/",
+    "https://api.open-meteo.com/",
+    "https://geocoding-api.open-meteo.com/",
+    "https://api.dictionaryapi.dev/",
+)
+
+def warm_plotting():
+    """Build matplotlib's font cache and load the style libraries."""
+    from matplotlib import font_manager
+    font_manager.findfont("DejaVu Sans")
+    plt.style.library
+    if USE_CANDLES:
+        mpf.available_styles()
+
+async def warm_connections() -> dict[str, str]:
+    """Open pooled connections (TLS, DNS, cookies) to the upstreams we call most."""
+    async def yahoo():
+        frames = await asyncio.to_thread(yf_download_many, ["SPY"], period="5d", interval="1d")
+        if frames["SPY"].empty:  # yfinance logs failures instead of raising
+            raise RuntimeError("no data")
+
+    async def openai_api():
+        async with openai_limiter:
+            await openai_client.models.list()
+
+    async def head(url: str):
+        async with http_session().head(url, allow_redirects=False) as r:
+            await r.release()
+
+    checks = {"yahoo": yahoo()}
+    if openai_client:
+        checks["openai"] = openai_api()
+    for url in WARMUP_HOSTS:
+        checks[url.split("/")[2]] = head(url)
+    results = await asyncio.gather(*(asyncio.wait_for(c, 15) for c in checks.values()), return_exceptions=True)
+    return {
+        name: "ok" if not isinstance(r, BaseException) else type(r).__name__
+        for name, r in zip(checks, results)
+    }
+
+async def warm_up():
+    """Pay first-use costs after on_ready instead of on the first /stock or moderation call.
+
+    Imports the lazy dependencies, builds font/style caches, renders throwaway
+    charts through the /stock rendering path and opens upstream connections;
+    each step is timed. Runs as a background task so the gateway never waits.
+    """
+    timings = {}
+    started = step = time.perf_counter()
+
+    def lap(name: str):
+        nonlocal step
+        now = time.perf_counter()
+        timings[name] = now - step
+        step = now
+
+    try:
+        for module in LAZY_MODULES:
+            await asyncio.to_thread(module._load)
+        if openai_client:
+            await asyncio.to_thread(openai_client._load)
+        await asyncio.to_thread(ticker_index._load)
+        lap("imports")
+        await asyncio.to_thread(warm_plotting)
+        lap("fonts")
+        chart_renderer.start()
+        await chart_renderer.wait_ready()
+        hist = await asyncio.to_thread(sample_history)
+        for style in chart_styles():
+            await chart_renderer.render(hist, float(hist["Close"].iloc[-1]), "warm-up", style)
+        lap("chart")
+        connections = await warm_connections()
+        lap("connections")
+    except Exception as e:
+        print("Warm-up failed:", e)
+        return
+    steps = " • ".join(f"{name} {sec:.2f}s" for name, sec in timings.items())
+    conns = ", ".join(f"{name} {state}" for name, state in connections.items())
+    workers = f" + {chart_renderer.rss_mb():.0f} MB in {len(chart_renderer.pids)} chart worker(s)" if chart_renderer.pids else ""
+    print(f"Warm-up done in {time.perf_counter() - started:.2f}s ({steps}) • RSS {rss_mb():.0f} MB{workers}")
+    print(f"Warm connections: {conns}")
+
 @client.event
 async def on_ready():
+    if not getattr(client, "booted", False):
+        client.booted = True
+        print_diagnostics()
+        loaded = [m._name for m in LAZY_MODULES if m.loaded]
+        print(
+            f"Ready in {time.perf_counter() - BOOT_STARTED:.2f}s • RSS {rss_mb():.0f} MB • "
+            f"heavy modules loaded: {', '.join(loaded) or 'none'}"
+        )
+        if STARTUP_WARMUP:
+            client.warmup_task = asyncio.create_task(warm_up())
     await client.change_presence(status=discord.Status.idle, activity=discord.Activity(type=discord.ActivityType.watching, name="over homelab"))
     client.add_view(RolePicker())
     if not getattr(client, "synced", False):
@@ -343,8 +1490,13 @@ async def on_ready():
         except Exception as e:
             print("Sync failed:", e)
     
+    purge_jobs.resume()
+
     if openai_client:
         print("OpenAI moderation enabled")
+        moderation_queue.start()
+        if not getattr(client, "warning_pool_task", None):
+            client.warning_pool_task = asyncio.create_task(warning_pool.run())
     else:
         print("OpenAI moderation disabled - set OPENAI_API_KEY to enable")
 
@@ -365,33 +1517,13 @@ async def on_message(message):
     if not openai_client:
         return
     
-    # Moderate text content
-    if message.content.strip():
-        try:
-            moderation_result = await moderate_text(message.content)
-            if moderation_result:
-                await handle_moderation_result(message, moderation_result, "message")
-                return  # Don't check images if text was flagged
-        except Exception as e:
-            print(f"Error moderating text: {e}")
-    
-    # Moderate image attachments
-    for attachment in message.attachments:
-        if any(attachment.filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp']):
-            try:
-                moderation_result = await moderate_image(attachment.url)
-                if moderation_result:
-                    await handle_moderation_result(message, moderation_result, "image")
-                    break  # Stop checking other images if one is flagged
-            except Exception as e:
-                print(f"Error moderating image: {e}")
-                continue
+    moderation_queue.submit(message)
 
 @client.event
 async def on_close():
-    global _http
-    if _http and not _http.closed:
-        await _http.close()
+    await http_client.close()
+    if openai_client:
+        await openai_client.close()
 
 cooldown_fast = app_commands.checks.cooldown(1, 3.0)
 cooldown_medium = app_commands.checks.cooldown(2, 10.0)
@@ -415,18 +1547,439 @@ async def status_cmd(inter: discord.Interaction):
     desc = f"Bot: {u.mention if u else '—'}\nPresence: watching over homelab\nLatency: {round(client.latency * 1000)} ms\n{now_utc_iso()}"
     await reply_embed(inter, "Status", desc, ephemeral=True)
 
-@tree.command(name="purge", description="Bulk delete messages with optional filters.")
+class DeletionScheduler:
+    """Send Discord delete calls as fast as their rate-limit buckets allow.
+
+    discord.py already holds each request until its per-route bucket has budget
+    (from the X-RateLimit-* headers) and retries 429s itself, so no fixed sleeps
+    are needed between calls. What it gives up on is retried here: 429s wait
+    exactly Retry-After, 5xx responses back off exponentially with jitter.
+    403/404 and other client errors are raised to the caller. An optional shared
+    budget caps the total call rate across callers; it is off unless configured.
+    """
+
+    def __init__(self, max_attempts: int = 4, budget: "TokenBucket | None" = None):
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.retries = 0
+        self.waited = 0.0
+
+    @staticmethod
+    def _retry_after(error: discord.HTTPException) -> float:
+        headers = getattr(error.response, "headers", None) or {}
+        try:
+            return max(float(headers.get("Retry-After", 1.0)), 0.05)
+        except (TypeError, ValueError):
+            return 1.0
+
+    async def run(self, call) -> bool:
+        """Await ``call()`` until it succeeds (True) or retries run out (False)."""
+        backoff = 1.0
+        for attempt in range(self.max_attempts):
+            if self.budget:
+                await self.budget.acquire()
+            try:
+                await call()
+                return True
+            except discord.RateLimited as e:
+                wait = e.retry_after
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    wait = self._retry_after(e)
+                elif e.status >= 500:
+                    wait = backoff * random.uniform(0.5, 1.5)
+                    backoff *= 2
+                else:
+                    raise
+            if attempt == self.max_attempts - 1:
+                break
+            self.retries += 1
+            self.waited += wait
+            await asyncio.sleep(wait)
+        return False
+
+class TokenBucket:
+    """Async token bucket: at most ``rate`` acquisitions per second, bursting to ``burst``."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(rate, 0.01)
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PurgeJob:
+    """One /purge run: its filters, progress counters and resume checkpoint.
+
+    ``checkpoint`` is the ID of the oldest message whose fate is settled (deleted
+    or skipped); a resumed job scans again from just before it. ``frontier`` is
+    the oldest message scanned so far and ``frontier_scanned`` the count at that
+    point, so a resumed scan knows where the original window ends even after
+    messages in between were deleted.
+    """
+
+    FIELDS = (
+        "id", "guild_id", "channel_id", "requested_by", "amount", "contains", "from_user_id",
+        "bots_only", "dry_run", "after_id", "before_id", "pattern", "state", "scanned", "bulk", "old", "checkpoint", "checkpoint_scanned",
+        "frontier", "frontier_scanned", "error", "created_at",
+    )
+
+    def __init__(self, guild_id: int, channel_id: int, requested_by: str, amount: int, *,
+                 contains: str | None = None, from_user_id: int | None = None, bots_only: bool = False,
+                 dry_run: bool = False, after_id: int | None = None, before_id: int | None = None,
+                 pattern: str | None = None, **progress):
+        self.id = 0
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.requested_by = requested_by
+        self.amount = amount
+        self.contains = contains
+        self.from_user_id = from_user_id
+        self.bots_only = bots_only
+        self.dry_run = dry_run
+        self.after_id = after_id
+        self.before_id = before_id
+        self.pattern = pattern
+        self.state = "queued"
+        self.scanned = 0
+        self.bulk = 0
+        self.old = 0
+        self.checkpoint: int | None = None
+        self.checkpoint_scanned = 0
+        self.frontier: int | None = None
+        self.frontier_scanned = 0
+        self.error: str | None = None
+        self.created_at = time.time()
+        for key, value in progress.items():
+            if key in self.FIELDS:
+                setattr(self, key, value)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PurgeJob":
+        data = dict(data)
+        return cls(data.pop("guild_id"), data.pop("channel_id"), data.pop("requested_by"), data.pop("amount"), **data)
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "cancelled", "failed")
+
+    def summary(self) -> str:
+        verb = "Would purge" if self.dry_run else "Purged"
+        return f"{verb} {self.bulk} (bulk) + {self.old} (old) out of {self.scanned} scanned"
+
+    def describe(self) -> str:
+        line = f"#{self.id} <#{self.channel_id}> — {self.state} — {self.scanned}/{self.amount} scanned, {self.bulk + self.old} {'matched' if self.dry_run else 'deleted'}"
+        return f"{line} ({self.error})" if self.error else line
+
+
+PURGE_PATTERN_MAX_LEN = 200
+PURGE_PATTERN_SPECIAL = set(".^$*+?{}[]()")
+
+def compile_purge_pattern(pattern: str) -> re.Pattern:
+    """Compile a /purge pattern: literal phrases separated by ``|``, case-insensitive.
+
+    Matching runs on the event loop, and a full regex can backtrack for minutes
+    (``^(a|aa)*$``), so only alternation of literals is accepted; a backslash
+    makes the next punctuation character (``\\|``, ``\\.``) literal.
+    """
+    if len(pattern) > PURGE_PATTERN_MAX_LEN:
+        raise ValueError(f"pattern is longer than {PURGE_PATTERN_MAX_LEN} characters")
+    phrases, current = [], []
+    chars = iter(pattern)
+    for ch in chars:
+        if ch == "\\":
+            ch = next(chars, "")
+            if not ch or ch.isalnum() or ch.isspace():
+                raise ValueError("`\\` can only escape punctuation, e.g. `\\|` or `\\.`")
+            current.append(ch)
+        elif ch == "|":
+            phrases.append("".join(current))
+            current = []
+        elif ch in PURGE_PATTERN_SPECIAL:
+            raise ValueError(f"only phrases separated by `|` are supported; write `\\{ch}` to match `{ch}` itself")
+        else:
+            current.append(ch)
+    phrases.append("".join(current))
+    if not all(p.strip() for p in phrases):
+        raise ValueError("empty phrase in pattern")
+    return re.compile("|".join(re.escape(p) for p in phrases), re.IGNORECASE)
+
+
+async def run_purge_job(job: PurgeJob, channel: discord.TextChannel, scheduler: "DeletionScheduler",
+                        on_progress=None, on_checkpoint=None):
+    """Scan ``channel`` newest-first and delete matching messages while scanning continues.
+
+    Time/ID bounds go straight into ``channel.history``, so the scan starts at the
+    window's newest edge and stops as soon as it passes the oldest one.
+    ``on_checkpoint`` is called before and after every deleted chunk so the
+    frontier and checkpoint on disk always cover what has been deleted.
+    """
+    if job.dry_run or (job.checkpoint is None and job.frontier is None):
+        job.scanned = job.bulk = job.old = 0
+        job.checkpoint = job.frontier = None
+        job.frontier_scanned = 0
+    else:
+        job.scanned = job.checkpoint_scanned
+    substr = job.contains.lower() if job.contains else None
+    matcher = compile_purge_pattern(job.pattern) if job.pattern else None
+    cutoff = discord.utils.utcnow() - dt.timedelta(days=14)
+    reason = f"/purge by {job.requested_by}"
+    # at most two full chunks wait for deletion while scanning continues
+    pending: asyncio.Queue = asyncio.Queue(maxsize=2)
+
+    async def delete_chunks():
+        while (item := await pending.get()) is not None:
+            kind, chunk, checkpoint, scanned = item
+            if on_checkpoint and chunk:
+                on_checkpoint()  # the frontier already covers this chunk
+            try:
+                if kind == "bulk" and chunk:
+                    try:
+                        if await scheduler.run(lambda: channel.delete_messages(chunk, reason=reason)):
+                            job.bulk += len(chunk)
+                        chunk = []
+                    except discord.NotFound:
+                        pass  # some are already gone; delete the rest one by one
+                for m in chunk:
+                    try:
+                        if await scheduler.run(lambda m=m: m.delete(reason=reason)):
+                            setattr(job, kind, getattr(job, kind) + 1)
+                    except discord.NotFound:
+                        pass
+            except Exception as e:
+                print(f"Purge job #{job.id} deletion error: {e}")
+            job.checkpoint, job.checkpoint_scanned = checkpoint, scanned
+            if on_checkpoint and chunk:
+                on_checkpoint()
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(3.0)
+            await on_progress(job, False)
+
+    async def flush(kind: str, chunk: list[discord.Message], checkpoint: int | None, scanned: int):
+        if job.dry_run:
+            setattr(job, kind, getattr(job, kind) + len(chunk))
+        elif checkpoint:
+            await pending.put((kind, chunk, checkpoint, scanned))
+
+    deleter = None if job.dry_run else asyncio.create_task(delete_chunks())
+    reporter = asyncio.create_task(report_progress()) if on_progress else None
+    start = job.checkpoint or job.before_id
+    before = discord.Object(id=start) if start else None
+    after = discord.Object(id=job.after_id) if job.after_id else None
+    recent: list[discord.Message] = []
+    old: list[discord.Message] = []
+    last_id = job.checkpoint
+    try:
+        history = channel.history(limit=None, before=before, after=after, oldest_first=False)
+        async for m in history:
+            if job.after_id and m.id <= job.after_id:
+                break
+            if job.frontier and m.id >= job.frontier:
+                # resumed: this stretch was counted before the restart
+                job.scanned = min(job.scanned + 1, job.frontier_scanned)
+            elif max(job.scanned, job.frontier_scanned) >= job.amount:
+                break
+            else:
+                job.scanned = max(job.scanned, job.frontier_scanned) + 1
+                job.frontier, job.frontier_scanned = m.id, job.scanned
+            previous_id = last_id
+            last_id = m.id
+            matches = not (m.pinned or m.is_system())
+            if matches and substr and substr not in m.content.lower():
+                matches = False
+            if matches and matcher and not matcher.search(m.content):
+                matches = False
+            if matches and job.from_user_id and m.author.id != job.from_user_id:
+                matches = False
+            if matches and job.bots_only and not m.author.bot:
+                matches = False
+            if matches:
+                # history is newest-first, so once messages are old they stay old
+                if m.created_at > cutoff:
+                    recent.append(m)
+                else:
+                    if recent:
+                        await flush("bulk", recent, previous_id, job.scanned - 1)
+                        recent = []
+                    old.append(m)
+                for kind, batch in (("bulk", recent), ("old", old)):
+                    if len(batch) == 100:
+                        await flush(kind, batch[:], m.id, job.scanned)
+                        batch.clear()
+            elif not recent and not old and job.scanned % 100 == 0:
+                # nothing pending: let the checkpoint move past skipped messages
+                await flush("bulk", [], m.id, job.scanned)
+        job.scanned = max(job.scanned, job.frontier_scanned)
+        await flush("bulk", recent, last_id, job.scanned)
+        await flush("old", old, last_id, job.scanned)
+        if deleter:
+            await pending.put(None)
+            await deleter
+    finally:
+        if deleter:
+            deleter.cancel()
+        if reporter:
+            reporter.cancel()
+
+
+class PurgeJobRegistry:
+    """Background /purge jobs, saved to disk so they resume after a restart.
+
+    At most PURGE_MAX_ACTIVE_JOBS run at once; the rest wait their turn. Deletes
+    go as fast as Discord's rate-limit buckets allow; setting PURGE_CALLS_PER_SEC
+    additionally caps all jobs together at that many calls per second.
+    """
+
+    def __init__(self, path: str, max_active: int, calls_per_sec: float):
+        self.path = path
+        self.jobs: dict[int, PurgeJob] = {}
+        self.budget = TokenBucket(calls_per_sec, calls_per_sec) if calls_per_sec > 0 else None
+        self.scheduler = DeletionScheduler(budget=self.budget)
+        self._max_active = max(1, max_active)
+        self._slots: asyncio.Semaphore | None = None
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._cancelled: set[int] = set()
+        self._saved_at = 0.0
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.jobs = {job["id"]: PurgeJob.from_dict(job) for job in json.load(f)}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not load purge jobs from {self.path}: {e}")
+
+    def save(self, force: bool = False):
+        if not force and time.monotonic() - self._saved_at < 2.0:
+            return
+        self._saved_at = time.monotonic()
+        # keep every unfinished job plus the 20 most recent finished ones
+        finished = sorted((j for j in self.jobs.values() if j.finished), key=lambda j: j.id)[:-20]
+        for job in finished:
+            del self.jobs[job.id]
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump([job.to_dict() for job in self.jobs.values()], f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save purge jobs to {self.path}: {e}")
+
+    def submit(self, job: PurgeJob, on_progress=None) -> PurgeJob:
+        job.id = max(self.jobs, default=0) + 1
+        self.jobs[job.id] = job
+        self.save(force=True)
+        self._start(job, on_progress)
+        return job
+
+    def resume(self):
+        for job in self.jobs.values():
+            if not job.finished and job.id not in self._tasks:
+                job.state = "queued"
+                print(f"Resuming purge job #{job.id} in channel {job.channel_id} from {job.checkpoint or 'the start'}")
+                self._start(job, None)
+
+    def cancel(self, job_id: int) -> bool:
+        task = self._tasks.get(job_id)
+        if not task:
+            return False
+        self._cancelled.add(job_id)
+        task.cancel()
+        return True
+
+    def _start(self, job: PurgeJob, on_progress):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_active)
+        self._tasks[job.id] = asyncio.create_task(self._run(job, on_progress))
+
+    async def _run(self, job: PurgeJob, on_progress):
+        async def progress(job: PurgeJob, final: bool):
+            self.save()
+            if on_progress:
+                await on_progress(job, final)
+
+        try:
+            async with self._slots:
+                job.state = "running"
+                self.save(force=True)
+                channel = client.get_channel(job.channel_id) or await client.fetch_channel(job.channel_id)
+                await run_purge_job(job, channel, self.scheduler, progress, lambda: self.save(force=True))
+                job.state = "done"
+        except asyncio.CancelledError:
+            if job.id not in self._cancelled:
+                raise  # shutting down: stay unfinished on disk so resume() picks it up
+            job.state = "cancelled"
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e) or type(e).__name__
+            print(f"Purge job #{job.id} failed: {job.error}")
+        finally:
+            self._tasks.pop(job.id, None)
+            self._cancelled.discard(job.id)
+            self.save(force=True)
+        await progress(job, True)
+
+DURATION_RE = re.compile(r"(\d+)\s*([smhdw])", re.IGNORECASE)
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_history_bound(value: str) -> int:
+    """Turn "2h30m" (ago), an ISO timestamp, a message ID or a message link into a snowflake."""
+    value = value.strip()
+    tail = value.rstrip("/").rsplit("/", 1)[-1]
+    if tail.isdigit() and len(tail) >= 15:
+        return int(tail)
+    if DURATION_RE.search(value) and not DURATION_RE.sub("", value).strip():
+        seconds = sum(int(n) * DURATION_UNITS[u.lower()] for n, u in DURATION_RE.findall(value))
+        return discord.utils.time_snowflake(discord.utils.utcnow() - dt.timedelta(seconds=seconds))
+    try:
+        when = dt.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Couldn't read `{value}` — use e.g. `2h`, `2024-05-01 18:00`, or a message ID/link.")
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=dt.timezone.utc)
+    return discord.utils.time_snowflake(when)
+
+purge_jobs = PurgeJobRegistry(PURGE_JOBS_PATH, PURGE_MAX_ACTIVE_JOBS, PURGE_CALLS_PER_SEC)
+purge_jobs.load()
+
+purge_group = app_commands.Group(
+    name="purge",
+    description="Bulk delete messages in the background.",
+    default_permissions=discord.Permissions(manage_messages=True, use_application_commands=True),
+    guild_ids=[GUILD_ID] if GUILD_ID else None,
+)
+
+@purge_group.command(name="start", description="Bulk delete messages with optional filters.")
 @app_commands.describe(
     amount="Max messages to scan (1–5000, default 200)",
     contains="Only delete messages containing this text",
     from_user="Only delete messages from this user",
     bots_only="Only delete messages sent by bots",
-    dry_run="Show what would be deleted without removing"
+    dry_run="Show what would be deleted without removing",
+    channel="Channel to purge (default: this one)",
+    after="Only messages newer than this: age like 2h, a UTC time, or a message ID/link",
+    before="Only messages older than this: age like 30m, a UTC time, or a message ID/link",
+    pattern="Only delete messages containing any of these phrases, separated by | (case-insensitive)",
 )
 @cooldown_medium
-@app_commands.default_permissions(manage_messages=True, use_application_commands=True)
 @app_commands.checks.has_permissions(manage_messages=True)
-@app_commands.guilds(discord.Object(id=GUILD_ID)) if GUILD_ID else (lambda f: f)
 async def purge_cmd(
     inter: discord.Interaction,
     amount: app_commands.Range[int, 1, 5000] = 200,
@@ -434,76 +1987,76 @@ async def purge_cmd(
     from_user: discord.User | None = None,
     bots_only: bool = False,
     dry_run: bool = False,
+    channel: discord.TextChannel | None = None,
+    after: str | None = None,
+    before: str | None = None,
+    pattern: str | None = None,
 ):
     await inter.response.defer(ephemeral=use_ephemeral(inter), thinking=True)
     try:
-        channel = inter.channel
-        if not inter.guild or not isinstance(channel, discord.TextChannel):
-            return await inter.followup.send(
-                embed=emb("Purge", "This only works in server text channels."),
-                ephemeral=use_ephemeral(inter),
-            )
-
-        scanned_msgs = [m async for m in channel.history(limit=amount)]
-        scanned = len(scanned_msgs)
-        substr = contains.lower() if contains else None
-        targets: list[discord.Message] = []
-        for m in scanned_msgs:
-            if m.pinned or m.is_system():
-                continue
-            if substr and substr not in m.content.lower():
-                continue
-            if from_user and m.author.id != from_user.id:
-                continue
-            if bots_only and not m.author.bot:
-                continue
-            targets.append(m)
+        after_id = parse_history_bound(after) if after else None
+        before_id = parse_history_bound(before) if before else None
+        if pattern:
+            compile_purge_pattern(pattern)
+    except ValueError as e:
+        return await inter.followup.send(embed=emb("Purge", f"Invalid filter: {e}"), ephemeral=use_ephemeral(inter))
+    target = channel or inter.channel
+    if not inter.guild or not isinstance(target, discord.TextChannel):
+        return await inter.followup.send(
+            embed=emb("Purge", "This only works in server text channels."),
+            ephemeral=use_ephemeral(inter),
+        )
+    if not target.permissions_for(inter.user).manage_messages:
+        return await inter.followup.send(
+            embed=emb("Purge", f"You can't manage messages in {target.mention}."),
+            ephemeral=use_ephemeral(inter),
+        )
 
-        cutoff = discord.utils.utcnow() - dt.timedelta(days=14)
-        recent = [m for m in targets if m.created_at > cutoff]
-        old = [m for m in targets if m.created_at <= cutoff]
+    # the interaction token lasts 15 minutes; after that, progress is only in /purge status
+    started = time.monotonic()
 
-        reason = f"/purge by {inter.user}"
-        bulk_deleted = 0
-        old_deleted = 0
+    async def report(job: PurgeJob, final: bool):
+        if time.monotonic() - started > 14 * 60:
+            return
+        if final:
+            desc = job.summary() if job.state == "done" else f"Job #{job.id} {job.state}. {job.summary()}"
+        else:
+            desc = f"Job #{job.id} {job.state}… {job.scanned} scanned, {job.bulk + job.old} {'matched' if job.dry_run else 'deleted'} so far."
+        try:
+            await inter.edit_original_response(embed=emb("Purge", desc))
+        except discord.HTTPException:
+            pass
+
+    job = PurgeJob(
+        inter.guild.id, target.id, str(inter.user), amount,
+        contains=contains, from_user_id=from_user.id if from_user else None, bots_only=bots_only, dry_run=dry_run,
+        after_id=after_id, before_id=before_id, pattern=pattern,
+    )
+    purge_jobs.submit(job, report)
+    note = " This may take a while — check `/purge status`." if amount > 1000 else ""
+    await inter.edit_original_response(embed=emb("Purge", f"Started job #{job.id} in {target.mention}.{note}"))
 
-        if not dry_run:
-            for i in range(0, len(recent), 100):
-                chunk = recent[i:i + 100]
-                try:
-                    await channel.delete_messages(chunk, reason=reason)
-                    bulk_deleted += len(chunk)
-                except discord.HTTPException:
-                    await asyncio.sleep(2.0)
-                    try:
-                        await channel.delete_messages(chunk, reason=reason)
-                        bulk_deleted += len(chunk)
-                    except discord.HTTPException:
-                        pass
-                await asyncio.sleep(0.25)
+@purge_group.command(name="status", description="Show purge jobs in this server.")
+@cooldown_fast
+@app_commands.checks.has_permissions(manage_messages=True)
+async def purge_status_cmd(inter: discord.Interaction):
+    jobs = sorted((j for j in purge_jobs.jobs.values() if inter.guild and j.guild_id == inter.guild.id), key=lambda j: j.id)
+    lines = [job.describe() for job in jobs[-10:]]
+    await reply_embed(inter, "Purge Jobs", "\n".join(lines) or "No purge jobs.", ephemeral=True)
 
-            for m in old:
-                try:
-                    await m.delete(reason=reason)
-                    old_deleted += 1
-                    await asyncio.sleep(0.85)
-                except discord.HTTPException:
-                    await asyncio.sleep(1.75)
-        else:
-            bulk_deleted = len(recent)
-            old_deleted = len(old)
+@purge_group.command(name="cancel", description="Cancel a running or queued purge job.")
+@app_commands.describe(job_id="Job number from /purge status")
+@cooldown_fast
+@app_commands.checks.has_permissions(manage_messages=True)
+async def purge_cancel_cmd(inter: discord.Interaction, job_id: int):
+    job = purge_jobs.jobs.get(job_id)
+    if not job or not inter.guild or job.guild_id != inter.guild.id:
+        return await reply_embed(inter, "Purge", f"No job #{job_id} in this server.")
+    if not purge_jobs.cancel(job_id):
+        return await reply_embed(inter, "Purge", f"Job #{job_id} is already {job.state}.")
+    await reply_embed(inter, "Purge", f"Cancelling job #{job_id}.", ephemeral=True)
 
-        note = " This may take a while." if amount > 1000 else ""
-        if dry_run:
-            desc = f"Would purge {bulk_deleted} (bulk) + {old_deleted} (old) out of {scanned} scanned{note}"
-        else:
-            desc = f"Purged {bulk_deleted} (bulk) + {old_deleted} (old) out of {scanned} scanned{note}"
-        await inter.followup.send(embed=emb("Purge", desc), ephemeral=use_ephemeral(inter))
-    except Exception:
-        await inter.followup.send(
-            embed=emb("Purge", "Something went wrong while purging."),
-            ephemeral=use_ephemeral(inter),
-        )
+tree.add_command(purge_group)
 
 @tree.command(name="help", description="Show available commands.")
 @cooldown_fast
@@ -511,8 +2064,10 @@ async def purge_cmd(
 async def help_cmd(inter: discord.Interaction):
     lines = [
         "/status — bot presence + latency",
-        "/purge — bulk delete messages with filters (requires Manage Messages)",
+        "/purge start — bulk delete messages with filters, in the background (requires Manage Messages)",
+        "/purge status | cancel — list or stop purge jobs",
         "/moderate — manually check content for policy violations (requires Manage Messages)",
+        "/modstats — moderation cache and pipeline counters (requires Manage Messages)",
         "/yt <query> [limit] — search via Piped",
         "/wiki <query> — short summary",
         "/avatar [user] — show user's avatar",
@@ -522,7 +2077,8 @@ async def help_cmd(inter: discord.Interaction):
         "/dog — random dog picture",
         "/cat — random cat picture",
         "/weather <place> [unit] — current weather",
-        "/stock <symbol> — show stock price & chart",
+        "/stock <symbol> [mode] [indicators] — stock price & chart (RSI, MACD, bands, volume); compare tickers or follow live",
+        "/watchlist show | add | remove — your saved tickers in one table and chart",
         "/rolesetup — post role picker (owner only)",
         "/resync <scope> — refresh commands (owner only)",
     ]
@@ -557,12 +2113,11 @@ async def moderate_cmd(
         try:
             text_result = await moderate_text(text)
             if text_result:
-                flagged_categories = [cat for cat, flagged in text_result.categories.model_dump().items() if flagged]
                 results.append({
                     "type": "Text",
                     "flagged": text_result.flagged,
-                    "categories": flagged_categories,
-                    "category_scores": text_result.category_scores.model_dump()
+                    "categories": text_result.categories,
+                    "category_scores": text_result.scores
                 })
         except Exception as e:
             results.append({"type": "Text", "error": str(e)})
@@ -572,12 +2127,11 @@ async def moderate_cmd(
         try:
             image_result = await moderate_image(image_url)
             if image_result:
-                flagged_categories = [cat for cat, flagged in image_result.categories.model_dump().items() if flagged]
                 results.append({
                     "type": "Image",
                     "flagged": image_result.flagged,
-                    "categories": flagged_categories,
-                    "category_scores": image_result.category_scores.model_dump()
+                    "categories": image_result.categories,
+                    "category_scores": image_result.scores
                 })
         except Exception as e:
             results.append({"type": "Image", "error": str(e)})
@@ -612,6 +2166,24 @@ async def moderate_cmd(
     embed.set_footer(text="Moderation powered by OpenAI")
     await inter.followup.send(embed=embed, ephemeral=use_ephemeral(inter))
 
+@tree.command(name="modstats", description="Moderation cache and pipeline counters.")
+@cooldown_fast
+@app_commands.default_permissions(manage_messages=True, use_application_commands=True)
+@app_commands.checks.has_permissions(manage_messages=True)
+@app_commands.guilds(discord.Object(id=GUILD_ID)) if GUILD_ID else (lambda f: f)
+async def modstats_cmd(inter: discord.Interaction):
+    lines = [
+        f"Text cache — {moderation_cache.stats()}",
+        f"Image cache (exact) — {image_cache.stats()}",
+        f"Image cache (perceptual hints) — {image_phash_cache.stats()} • "
+        f"{phash_stats['agreed']}/{phash_stats['hints']} near matches agreed with the API",
+        f"Pre-filter — {prefilter_stats['trusted']} trusted, {prefilter_stats['blocked']} blocked, "
+        f"{prefilter_stats['allowed']} allowed • {prefilter_stats['saved']} API calls saved",
+        f"Queue — {moderation_queue.describe()}",
+        f"Bursts — {violation_tracker.bursts} coalesced ({violation_tracker.coalesced} messages)",
+    ]
+    await reply_embed(inter, "Moderation Stats", "\n".join(lines), ephemeral=True)
+
 @tree.command(name="yt", description="Search YouTube via your Piped instance.")
 @app_commands.describe(query="Search terms", limit="Max links (1–5, default 3)")
 @cooldown_medium
@@ -1010,85 +2582,688 @@ async def resync_cmd(inter: discord.Interaction, scope: app_commands.Choice[str]
     except Exception as e:
         return await inter.followup.send(embed=emb("Resync", f"Failed: {e}"), ephemeral=use_ephemeral(inter))
 
-# quick fuzzy ticker autocorrect
-def normalize_symbol(s: str) -> str:
-    fixes = {
-        "APPL": "AAPL",
-        "TESLA": "TSLA",
-        "MICROSOFT": "MSFT",
-        "GOOGLE": "GOOGL",
-        "AMAZON": "AMZN",
-        "FACEBOOK": "META",
-        "NVIDIA": "NVDA",
-        "NETFLIX": "NFLX",
-        "INTEL": "INTC",
-    }
-    s = s.strip().upper()
-    s = fixes.get(s, s)
-    tickers = [
-        "AAPL",
-        "TSLA",
-        "MSFT",
-        "GOOGL",
-        "AMZN",
-        "META",
-        "NVDA",
-        "NFLX",
-        "AMD",
-        "INTC",
-    ]
-    if s in tickers:
-        return s
-    match = difflib.get_close_matches(s, tickers, n=1, cutoff=0.6)
-    return match[0] if match else s
+TICKER_SYMBOL_RE = re.compile(r"^[A-Z0-9^][A-Z0-9.\-=^]{0,11}$")
+TICKER_NAME_NOISE = re.compile(
+    r"\b(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|sa|se|nv|lp|llc|ag|group|holdings?|the|class [abc])\b"
+)
+TICKER_ALIASES = {"APPL": "AAPL", "GOOGLE": "GOOGL", "FACEBOOK": "META"}
+
+class TickerIndex:
+    """Local symbol/company-name index behind /stock autocomplete and symbol checks.
+
+    Rows are ranked by file order (the bundled file lists prominent tickers first).
+    A prefix trie over symbols and name words keeps the best ``top`` rows at every
+    node, so suggestions are one walk down the trie; a trigram index covers typos.
+    """
+
+    def __init__(self, top: int = 25, max_depth: int = 12):
+        self.top = top
+        self.max_depth = max_depth
+        self.symbols: list[str] = []
+        self.names: list[str] = []
+        self.by_symbol: dict[str, int] = {}
+        self._trie: dict = {}
+        self._trigrams: dict[str, list[int]] = {}
+        self._gram_counts: list[int] = []
+        self._words: dict[str, int] = {}  # first significant name word -> best row
+        self.strict = False
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @staticmethod
+    def clean_name(name: str) -> str:
+        name = name.split(" - ")[0].casefold()  # NASDAQ listings: "Apple Inc. - Common Stock"
+        name = re.sub(r"[^\w&]+", " ", name)
+        return " ".join(TICKER_NAME_NOISE.sub(" ", name).split())
+
+    @staticmethod
+    def trigrams(text: str) -> set[str]:
+        text = f"  {text} "
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    def _insert(self, key: str, row: int):
+        node = self._trie
+        for ch in key[: self.max_depth]:
+            node = node.setdefault(ch, {"": []})
+            best = node[""]
+            if len(best) < self.top and row not in best:
+                best.append(row)  # rows arrive in rank order, so the list stays sorted
+
+    def add(self, symbol: str, name: str):
+        symbol = symbol.strip().upper()
+        if not symbol or symbol in self.by_symbol or not TICKER_SYMBOL_RE.match(symbol):
+            return
+        row = len(self.symbols)
+        self.symbols.append(symbol)
+        self.names.append(name.strip())
+        self.by_symbol[symbol] = row
+        cleaned = self.clean_name(name)
+        self._insert(symbol.casefold(), row)
+        for word in set(cleaned.split()):
+            self._insert(word, row)
+        if cleaned:
+            self._words.setdefault(cleaned.split()[0], row)
+        grams = self.trigrams(symbol.casefold()) | self.trigrams(cleaned)
+        self._gram_counts.append(len(grams))
+        for gram in grams:
+            self._trigrams.setdefault(gram, []).append(row)
+
+    def load(self, paths: list[str]) -> int:
+        """Read CSV (symbol,name) or NASDAQ Trader pipe files; later duplicates are ignored."""
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8", newline="") as f:
+                    header = f.readline()
+                    delimiter = "|" if "|" in header else ","
+                    columns = [c.strip().casefold() for c in header.split(delimiter)]
+                    sym_col = next(i for i, c in enumerate(columns) if "symbol" in c)
+                    name_col = next(i for i, c in enumerate(columns) if "name" in c)
+                    test_col = columns.index("test issue") if "test issue" in columns else None
+                    for row in csv.reader(f, delimiter=delimiter):
+                        if len(row) <= max(sym_col, name_col) or row[0].startswith("File Creation Time"):
+                            continue
+                        if test_col is not None and row[test_col].strip() == "Y":
+                            continue
+                        self.add(row[sym_col], row[name_col])
+            except (OSError, StopIteration, csv.Error) as e:
+                print(f"Could not load tickers from {path}: {e}")
+        return len(self)
+
+    def _prefix(self, text: str) -> list[int]:
+        node = self._trie
+        for ch in text[: self.max_depth]:
+            node = node.get(ch)
+            if node is None:
+                return []
+        return node[""] if node is not self._trie else []
+
+    def fuzzy(self, text: str, limit: int, min_score: float = 0.0) -> list[tuple[float, int]]:
+        """Rows sharing the most trigrams with ``text`` (Jaccard-style score, best first)."""
+        grams = self.trigrams(text)
+        counts: dict[int, int] = {}
+        for gram in grams:
+            for row in self._trigrams.get(gram, ()):
+                counts[row] = counts.get(row, 0) + 1
+        scored = []
+        for row, shared in counts.items():
+            score = shared / (len(grams) + self._gram_counts[row] - shared)
+            if score >= min_score:
+                scored.append((score, row))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored[:limit]
+
+    def suggest(self, query: str, limit: int = 25) -> list[tuple[str, str]]:
+        """(symbol, name) pairs for autocomplete: exact, then prefix, then typo matches."""
+        text = query.strip()
+        if not text:
+            return [(self.symbols[i], self.names[i]) for i in range(min(limit, len(self)))]
+        rows: dict[int, None] = {}
+        exact = self.by_symbol.get(text.upper())
+        if exact is not None:
+            rows[exact] = None
+        for row in self._prefix(text.casefold()):
+            rows.setdefault(row, None)
+        cleaned = self.clean_name(text)
+        if cleaned and cleaned != text.casefold():
+            for row in self._prefix(cleaned):
+                rows.setdefault(row, None)
+        if len(rows) < limit and len(text) >= 3:
+            for _, row in self.fuzzy(cleaned or text.casefold(), limit, min_score=0.2):
+                rows.setdefault(row, None)
+        return [(self.symbols[i], self.names[i]) for i in list(rows)[:limit]]
+
+    def resolve(self, query: str, strict: bool) -> str | None:
+        """Map user input to a symbol; None when it is rejected without a network call.
+
+        Non-strict indexes (a partial listing) pass through unknown but well-formed
+        symbols, and only correct names or long inputs, never ticker-shaped ones.
+        """
+        text = query.strip().upper().replace("$", "")
+        text = TICKER_ALIASES.get(text, text)
+        if text in self.by_symbol:
+            return text
+        dashed = text.replace(".", "-")  # BRK.B -> BRK-B (Yahoo spelling)
+        if dashed in self.by_symbol:
+            return dashed
+        cleaned = self.clean_name(text)
+        if cleaned in self._words:
+            return self.symbols[self._words[cleaned]]
+        looks_like_ticker = bool(TICKER_SYMBOL_RE.match(text)) and len(text) <= 5
+        if strict or not looks_like_ticker:
+            match = self.fuzzy(cleaned or text.casefold(), 2, min_score=0.3)
+            if match and (len(match) == 1 or match[0][0] - match[1][0] >= 0.1):  # only a clear winner
+                return self.symbols[match[0][1]]
+        if not strict and TICKER_SYMBOL_RE.match(dashed):
+            return dashed
+        return None
 
-def fetch_price_and_chart(symbol: str):
-    sym = normalize_symbol(symbol)
-    end = dt.datetime.utcnow()
-    # fetch a bit more than 90 days to ensure enough data for MA20
-    hist = yf.download(
-        sym,
-        period="120d",
-        interval="1d",
-        progress=False,
-        auto_adjust=True,
+def ticker_paths() -> list[str]:
+    here = os.path.dirname(os.path.abspath(__file__))
+    default = os.path.join(here, "tickers.csv")
+    return [p for p in (os.getenv("TICKERS_PATH") or default).split(os.pathsep) if p]
+
+def build_ticker_index() -> TickerIndex:
+    started = time.perf_counter()
+    index = TickerIndex()
+    index.load(ticker_paths())
+    # the bundled listing is complete enough to reject unknown symbols; a short custom list passes them to Yahoo
+    index.strict = {"1": True, "true": True, "0": False, "false": False}.get(
+        os.getenv("TICKER_STRICT", "auto").strip().lower(), len(index) >= 3000
+    )
+    print(f"Ticker index: {len(index)} symbols in {(time.perf_counter() - started) * 1000:.0f} ms (strict={index.strict})")
+    return index
+
+ticker_index: TickerIndex = Lazy("ticker index", build_ticker_index)
+
+def normalize_symbol(s: str) -> str | None:
+    """Resolve a ticker or company name locally; None if it can't be a valid symbol."""
+    return ticker_index.resolve(s, ticker_index.strict)
+
+def suggest_symbols(query: str, limit: int = 25) -> list[app_commands.Choice[str]]:
+    choices = []
+    for symbol, name in ticker_index.suggest(query, limit):
+        label = f"{symbol} — {name}"
+        choices.append(app_commands.Choice(name=label[:100], value=symbol))
+    return choices
+
+try:
+    MARKET_TZ = ZoneInfo("America/New_York")
+except Exception:  # pragma: no cover - no tz database in the image
+    MARKET_TZ = dt.timezone(dt.timedelta(hours=-5))
+
+def market_is_open(now: dt.datetime | None = None) -> bool:
+    """Regular US session, Mon–Fri 9:30–16:00 New York time (holidays not tracked)."""
+    local = (now or discord.utils.utcnow()).astimezone(MARKET_TZ)
+    return local.weekday() < 5 and dt.time(9, 30) <= local.time() < dt.time(16, 0)
+
+def seconds_until_market_open(now: dt.datetime | None = None) -> float:
+    now = now or discord.utils.utcnow()
+    local = now.astimezone(MARKET_TZ)
+    opens = local.replace(hour=9, minute=30, second=0, microsecond=0)
+    if local >= opens:
+        opens += dt.timedelta(days=1)
+    while opens.weekday() >= 5:
+        opens += dt.timedelta(days=1)
+    return (opens - local).total_seconds()
+
+def seconds_until_market_close(now: dt.datetime | None = None) -> float:
+    local = (now or discord.utils.utcnow()).astimezone(MARKET_TZ)
+    return (local.replace(hour=16, minute=0, second=0, microsecond=0) - local).total_seconds()
+
+def frame_nbytes(df) -> int:
+    return int(df.memory_usage(deep=True).sum()) if df is not None else 0
+
+# per-symbol yfinance frames, bounded by memory; TTLs are set per entry from the market clock
+price_cache = TTLCache(STOCK_CACHE_MAX_BYTES, STOCK_INTRADAY_TTL, sizeof=frame_nbytes)
+
+# rendered charts keyed by (symbol, last daily bar, last price, style)
+chart_cache = TTLCache(CHART_CACHE_MAX_BYTES, 86400, sizeof=len)
+
+def yf_download(sym: str, **kwargs) -> pd.DataFrame:
+    df = yf.download(sym, progress=False, auto_adjust=True, **kwargs)
+    if df is None:
+        return pd.DataFrame()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    return df
+
+def daily_ttl() -> float:
+    """Daily bars change only once per session: keep them until the next open.
+
+    While the market is open today's bar is still moving, so it is kept for at
+    most STOCK_DAILY_TTL_OPEN seconds and always refetched after the close.
+    """
+    if market_is_open():
+        return max(1.0, min(STOCK_DAILY_TTL_OPEN, seconds_until_market_close()))
+    return seconds_until_market_open()
+
+def intraday_ttl() -> float:
+    return STOCK_INTRADAY_TTL if market_is_open() else seconds_until_market_open()
+
+def get_daily_history(sym: str) -> pd.DataFrame:
+    """120 days of daily bars for ``sym`` (empty frame when unknown), cached."""
+    hist = price_cache.get(("1d", sym))
+    if hist is None:
+        # fetch a bit more than 90 days to ensure enough data for MA20
+        hist = yf_download(sym, period="120d", interval="1d")
+        # unknown symbols are remembered briefly so repeats don't hit Yahoo
+        price_cache.set(("1d", sym), hist, ttl=daily_ttl() if not hist.empty else 300)
+    return hist
+
+def get_intraday(sym: str) -> pd.DataFrame:
+    """Today's 1-minute bars for ``sym``, cached for a minute while the market is open."""
+    intraday = price_cache.get(("1m", sym))
+    if intraday is None:
+        intraday = yf_download(sym, period="1d", interval="1m")
+        price_cache.set(("1m", sym), intraday, ttl=intraday_ttl())
+    return intraday
+
+def normalize_symbols(text: str, limit: int = COMPARE_MAX_SYMBOLS) -> tuple[list[str], list[str]]:
+    """Split "aapl, msft tsla" into normalized, de-duplicated tickers (at most ``limit``).
+
+    Returns (symbols, rejected) where ``rejected`` is the input the index refused.
+    """
+    seen: dict[str, None] = {}
+    rejected = []
+    for part in re.split(r"[\s,;]+", text or ""):
+        if part:
+            sym = normalize_symbol(part)
+            if sym:
+                seen.setdefault(sym, None)
+            else:
+                rejected.append(part)
+    return list(seen)[:limit], rejected
+
+def yf_download_many(symbols: list[str], **kwargs) -> dict[str, pd.DataFrame]:
+    """One batched yf.download for several tickers, split back into per-symbol frames."""
+    df = yf.download(symbols, progress=False, auto_adjust=True, group_by="column", **kwargs)
+    frames = {sym: pd.DataFrame() for sym in symbols}
+    if df is None or df.empty:
+        return frames
+    if not isinstance(df.columns, pd.MultiIndex):  # a single ticker can come back flat
+        df.columns = pd.MultiIndex.from_product([df.columns, symbols[:1]])
+    for sym in df.columns.get_level_values(1).unique():
+        if sym in frames:
+            frames[sym] = df.xs(sym, axis=1, level=1).dropna(how="all")
+    return frames
+
+def get_daily_histories(symbols: list[str]) -> dict[str, pd.DataFrame]:
+    """Daily bars for several symbols; cache misses are fetched in a single request."""
+    out = {sym: price_cache.get(("1d", sym)) for sym in symbols}
+    missing = [sym for sym, hist in out.items() if hist is None]
+    if missing:
+        for sym, hist in yf_download_many(missing, period="120d", interval="1d").items():
+            price_cache.set(("1d", sym), hist, ttl=daily_ttl() if not hist.empty else 300)
+            out[sym] = hist
+    return out
+
+def refresh_intraday(symbols: list[str]) -> int:
+    """Refill expired 1-minute bars for ``symbols`` with one batched request; returns symbols fetched."""
+    missing = [sym for sym in symbols if price_cache.get(("1m", sym)) is None]
+    if missing:
+        for sym, intraday in yf_download_many(missing, period="1d", interval="1m").items():
+            price_cache.set(("1m", sym), intraday, ttl=intraday_ttl())
+    return len(missing)
+
+def compare_table(symbols: list[str]):
+    """Closes for ``symbols`` side by side, plus a summary of returns (blocking).
+
+    Returns (summary, normalized, unknown): ``summary`` has one row per symbol with
+    last price and 1d/1mo/90d changes, ``normalized`` is each close rebased to 100.
+    """
+    histories = get_daily_histories(symbols)
+    unknown = [sym for sym, hist in histories.items() if hist.empty or "Close" not in hist]
+    closes = pd.DataFrame({sym: hist["Close"] for sym, hist in histories.items() if sym not in unknown})
+    if closes.empty:
+        return None, None, unknown
+    closes = closes.tail(90).ffill()
+    values = closes.to_numpy()
+    last = values[-1]
+    def change(rows_back: int) -> np.ndarray:
+        base = values[max(0, len(values) - 1 - rows_back)]
+        return (last / base - 1) * 100
+    first_valid = closes.bfill().iloc[0].to_numpy()
+    summary = pd.DataFrame(
+        {"last": last, "day": change(1), "month": change(21), "period": (last / first_valid - 1) * 100},
+        index=closes.columns,
+    ).sort_values("period", ascending=False)
+    normalized = closes / first_valid * 100
+    return summary, normalized, unknown
+
+def format_compare_table(summary: pd.DataFrame) -> str:
+    lines = [f"{'':6} {'Last':>10} {'1D':>7} {'1M':>7} {'90D':>7}"]
+    for sym, row in summary.iterrows():
+        lines.append(f"{sym:6} {row['last']:>10,.2f} {row['day']:>+6.1f}% {row['month']:>+6.1f}% {row['period']:>+6.1f}%")
+    return "```\n" + "\n".join(lines) + "\n```"
+
+async def send_comparison(inter: discord.Interaction, symbols: list[str], title: str, rejected: list[str] = ()):
+    """Reply with the summary table and one combined performance chart."""
+    summary, normalized, unknown = await asyncio.to_thread(compare_table, symbols)
+    unknown = [*rejected, *unknown]
+    if summary is None:
+        return await inter.followup.send(
+            embed=emb(title, f"Couldn't find data for {', '.join(f'`{s}`' for s in unknown)}."),
+            ephemeral=use_ephemeral(inter),
+        )
+    png = await chart_renderer.render_compare(normalized, f"{title}  •  90-day performance")
+    desc = format_compare_table(summary)
+    if unknown:
+        desc += f"\nNo data for {', '.join(f'`{s}`' for s in unknown)}."
+    embed = emb(f"Stocks | {title}", desc)
+    embed.set_image(url="attachment://compare.png")
+    await inter.followup.send(
+        embed=embed, file=discord.File(io.BytesIO(png), filename="compare.png"), ephemeral=use_ephemeral(inter)
     )
-    if hist is None or hist.empty:
-        return None, None, None, None, None
 
-    if isinstance(hist.columns, pd.MultiIndex):
-        hist.columns = hist.columns.get_level_values(0)
+class WatchlistStore:
+    """Per-user ticker lists persisted as JSON ({user_id: [symbols]})."""
 
-    # trim to last 90 days if available
-    hist = hist.tail(90).copy()
-    hist["MA20"] = hist["Close"].rolling(20).mean()
+    def __init__(self, path: str, limit: int):
+        self.path = path
+        self.limit = limit
+        self.lists: dict[str, list[str]] = {}
 
-    closes = hist["Close"].dropna()
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.lists = {str(k): list(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not load watchlists from {self.path}: {e}")
 
-    # intraday for freshest price fallback
-    intraday = yf.download(sym, period="1d", interval="1m", progress=False, auto_adjust=True)
-    if intraday is not None and not intraday.empty:
-        if isinstance(intraday.columns, pd.MultiIndex):
-            intraday.columns = intraday.columns.get_level_values(0)
-        last_price = float(intraday["Close"].dropna().iloc[-1])
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.lists, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save watchlists to {self.path}: {e}")
+
+    def get(self, user_id: int) -> list[str]:
+        return list(self.lists.get(str(user_id), []))
+
+    def add(self, user_id: int, symbols: list[str]) -> list[str]:
+        current = self.get(user_id)
+        current += [s for s in symbols if s not in current]
+        self.lists[str(user_id)] = current[: self.limit]
+        self.save()
+        return self.lists[str(user_id)]
+
+    def remove(self, user_id: int, symbols: list[str]) -> list[str]:
+        current = [s for s in self.get(user_id) if s not in symbols]
+        if current:
+            self.lists[str(user_id)] = current
+        else:
+            self.lists.pop(str(user_id), None)
+        self.save()
+        return current
+
+watchlists = WatchlistStore(WATCHLIST_PATH, COMPARE_MAX_SYMBOLS)
+watchlists.load()
+
+INDICATOR_NAMES = ("rsi", "macd", "bollinger", "volume")
+INDICATOR_ALIASES = {"bb": "bollinger", "bands": "bollinger", "boll": "bollinger", "vol": "volume"}
+PANEL_INDICATORS = ("volume", "rsi", "macd")  # drawn below the price, in this order
+
+def parse_indicators(text: str | None) -> tuple[tuple[str, ...], list[str]]:
+    """"rsi, bb vol" -> (("rsi", "bollinger", "volume"), unknown names)."""
+    picked, unknown = set(), []
+    for part in re.split(r"[\s,;+]+", (text or "").lower()):
+        if not part:
+            continue
+        name = INDICATOR_ALIASES.get(part, part)
+        if name in INDICATOR_NAMES:
+            picked.add(name)
+        else:
+            unknown.append(part)
+    return tuple(n for n in INDICATOR_NAMES if n in picked), unknown
+
+def _ewm(x: np.ndarray, alpha: float, seed: float | None = None) -> np.ndarray:
+    """adjust=False EWM; with ``seed`` the recursion continues from a previous value."""
+    if seed is None:
+        return pd.Series(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    if len(x) <= 32:  # a handful of new bars: cheaper than a pandas round trip
+        out = np.empty(len(x))
+        for i, value in enumerate(x):
+            seed = out[i] = seed + alpha * (value - seed)
+        return out
+    return pd.Series(np.r_[seed, x]).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+def _rolling(x: np.ndarray, window: int, history: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Rolling mean/std over ``x`` using up to window-1 earlier values from ``history``."""
+    arr = np.r_[history[-(window - 1):] if len(history) else history, x]
+    mean = np.full(len(arr), np.nan)
+    std = np.full(len(arr), np.nan)
+    if len(arr) >= window:
+        views = np.lib.stride_tricks.sliding_window_view(arr, window)
+        mean[window - 1:] = views.mean(axis=1)
+        std[window - 1:] = views.std(axis=1)
+    return mean[-len(x):], std[-len(x):]
+
+def indicator_frame(index: pd.Index, close: np.ndarray, volume: np.ndarray, seed: pd.DataFrame | None = None) -> pd.DataFrame:
+    """RSI(14), MACD(12/26/9), Bollinger(20, 2σ) and 20-day volume MA for new bars.
+
+    Without ``seed`` the whole series is computed; with it, the recursions and
+    windows continue from the seed's last rows, so only ``close`` is processed.
+    """
+    last = seed.iloc[-1] if seed is not None and len(seed) else None
+    prev_close = last["close"] if last is not None else close[0]
+    delta = np.diff(close, prepend=prev_close)
+    avg_gain = _ewm(np.clip(delta, 0, None), 1 / 14, None if last is None else last["avg_gain"])
+    avg_loss = _ewm(np.clip(-delta, 0, None), 1 / 14, None if last is None else last["avg_loss"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))
+    if last is None:
+        rsi[:14] = np.nan
+    ema12 = _ewm(close, 2 / 13, None if last is None else last["ema12"])
+    ema26 = _ewm(close, 2 / 27, None if last is None else last["ema26"])
+    macd = ema12 - ema26
+    signal = _ewm(macd, 2 / 10, None if last is None else last["signal"])
+    history = seed["close"].to_numpy() if seed is not None else close[:0]
+    mid, std = _rolling(close, 20, history)
+    vol_history = seed["volume"].to_numpy() if seed is not None else volume[:0]
+    vol_ma, _ = _rolling(volume, 20, vol_history)
+    return pd.DataFrame(
+        {
+            "close": close, "volume": volume, "avg_gain": avg_gain, "avg_loss": avg_loss, "RSI": rsi,
+            "ema12": ema12, "ema26": ema26, "MACD": macd, "signal": signal, "MACD_hist": macd - signal,
+            "BB_mid": mid, "BB_upper": mid + 2 * std, "BB_lower": mid - 2 * std, "VOL_MA": vol_ma,
+        },
+        index=index,
+    )
+
+INDICATOR_COLUMNS = ("RSI", "MACD", "signal", "MACD_hist", "BB_upper", "BB_lower", "VOL_MA")
+indicator_cache = TTLCache(256, 7 * 86400)
+indicator_stats = {"full": 0, "incremental": 0, "unchanged": 0, "bars": 0}
+
+def indicators_for(sym: str, hist: pd.DataFrame) -> pd.DataFrame:
+    """Indicator columns aligned to ``hist``, reusing the symbol's previous frame.
+
+    The cached frame is matched against ``hist`` by timestamp and close; rows that
+    still agree are kept and only the new or revised bars at the end are computed.
+    """
+    close = hist["Close"].ffill().bfill().to_numpy(dtype="float64")
+    volume = hist["Volume"].fillna(0).to_numpy(dtype="float64") if "Volume" in hist else np.zeros(len(hist))
+    prev = indicator_cache.get(sym)
+    keep = 0
+    if prev is not None:
+        offset = int(prev.index.searchsorted(hist.index[0]))
+        if offset < len(prev) and prev.index[offset] == hist.index[0]:
+            old = prev.iloc[offset:]
+            n = min(len(old), len(hist))
+            same = (
+                (old.index[:n] == hist.index[:n])
+                & (old["close"].to_numpy()[:n] == close[:n])
+                & (old["volume"].to_numpy()[:n] == volume[:n])
+            )
+            keep = n if same.all() else int(np.argmin(same))
+    if keep == 0:
+        frame = indicator_frame(hist.index, close, volume)
+        indicator_stats["full"] += 1
+        indicator_stats["bars"] += len(hist)
+    elif keep == len(hist):
+        indicator_stats["unchanged"] += 1
+        return prev.reindex(hist.index)
     else:
-        last_price = float(closes.iloc[-1])
+        base = prev.iloc[: offset + keep]
+        new = indicator_frame(hist.index[keep:], close[keep:], volume[keep:], seed=base)
+        frame = pd.concat([base, new]).tail(400)
+        indicator_stats["incremental"] += 1
+        indicator_stats["bars"] += len(hist) - keep
+    indicator_cache.set(sym, frame)
+    return frame.reindex(hist.index)
+
+def _bar_verts(x: np.ndarray, bottom: np.ndarray, top: np.ndarray, half: float) -> np.ndarray:
+    return np.stack(
+        [np.column_stack([x - half, bottom]), np.column_stack([x - half, top]),
+         np.column_stack([x + half, top]), np.column_stack([x + half, bottom])],
+        axis=1,
+    )
 
-    # daily and monthly change percentages
-    prev_close = float(closes.iloc[-2]) if len(closes) >= 2 else last_price
-    month_close = float(closes.iloc[-21]) if len(closes) >= 21 else closes.iloc[0]
-    day_change_pct = ((last_price / prev_close) - 1) * 100 if prev_close else 0.0
-    month_change_pct = ((last_price / month_close) - 1) * 100 if month_close else 0.0
+class ChartTemplate:
+    """A pre-built /stock figure whose artists are updated in place for each chart.
 
-    arrow = "▲" if day_change_pct >= 0 else "▼"
-    title = f"{sym}  {arrow} {abs(day_change_pct):.2f}%  •  Last price ${last_price:,.2f}"
+    Figure, axes, style, locators and formatters are created once per (style,
+    panels) combination; a render only swaps artist data, limits and the title.
+    """
+
+    UP, DOWN = "#4CB391", "#EF5350"
+
+    def __init__(self, style: str, indicators: tuple[str, ...] = ()):
+        self.style = style
+        self.indicators = indicators
+        panels = [p for p in PANEL_INDICATORS if p in indicators]
+        height = 3.8 + 1.3 * len(panels)
+        with plt.style.context("dark_background"):
+            self.fig, axes = plt.subplots(
+                1 + len(panels), 1, figsize=(7, height), dpi=200 if style == "line" else 100, sharex=True,
+                gridspec_kw={"height_ratios": [3] + [1] * len(panels)}, squeeze=False,
+            )
+            axes = list(axes[:, 0])
+            self.ax = ax = axes[0]
+            self.panels = dict(zip(panels, axes[1:]))
+            if "bollinger" in indicators:
+                self.bb_fill = mcollections.PolyCollection([], facecolors="#8FA6FF", alpha=0.12, linewidths=0)
+                ax.add_collection(self.bb_fill)
+                (self.bb_upper,) = ax.plot([], [], color="#8FA6FF", linewidth=0.9)
+                (self.bb_lower,) = ax.plot([], [], color="#8FA6FF", linewidth=0.9)
+            if style == "candle":
+                self.wicks = mcollections.LineCollection([], linewidths=0.8)
+                self.bodies = mcollections.PolyCollection([], linewidths=0.5)
+                ax.add_collection(self.wicks)
+                ax.add_collection(self.bodies)
+                (self.ma,) = ax.plot([], [], color="orange", linewidth=1.2)
+                self.last = ax.scatter([], [], color="white", zorder=5, s=40)
+            else:
+                (self.close,) = ax.plot([], [], color="#4CB391", linewidth=2)
+                self.fill = mcollections.PolyCollection([], facecolors="#4CB391", alpha=0.2, linewidths=0)
+                ax.add_collection(self.fill)
+                (self.ma,) = ax.plot([], [], color="#FFE066", linewidth=1.5)
+                self.last = ax.scatter([], [], color="white", edgecolors="black", zorder=5, s=20)
+            if "volume" in self.panels:
+                vax = self.panels["volume"]
+                self.vol_bars = mcollections.PolyCollection([], linewidths=0)
+                vax.add_collection(self.vol_bars)
+                (self.vol_ma,) = vax.plot([], [], color="#FFE066", linewidth=1)
+                vax.yaxis.set_major_formatter(mticker.FuncFormatter(lambda v, _: f"{v / 1e6:,.0f}M"))
+                vax.set_ylabel("Vol", fontsize=8)
+            if "rsi" in self.panels:
+                rax = self.panels["rsi"]
+                (self.rsi,) = rax.plot([], [], color="#C792EA", linewidth=1.2)
+                for level in (30, 70):
+                    rax.axhline(level, color="gray", linewidth=0.8, linestyle="--")
+                rax.set_ylim(0, 100)
+                rax.set_yticks([30, 70])
+                rax.set_ylabel("RSI", fontsize=8)
+            if "macd" in self.panels:
+                max_ = self.panels["macd"]
+                self.macd_hist = mcollections.PolyCollection([], linewidths=0)
+                max_.add_collection(self.macd_hist)
+                (self.macd,) = max_.plot([], [], color="#4FC3F7", linewidth=1.1)
+                (self.signal,) = max_.plot([], [], color="#FFB74D", linewidth=1.1)
+                max_.axhline(0, color="gray", linewidth=0.6)
+                max_.set_ylabel("MACD", fontsize=8)
+            locator = mdates.AutoDateLocator(minticks=3, maxticks=8)
+            axes[-1].xaxis.set_major_locator(locator)
+            axes[-1].xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+            ax.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"${x:,.2f}"))
+            for a in axes:
+                a.grid(color="gray", alpha=0.3)
+                a.label_outer()
+            self.title = ax.set_title(" ")
+            self.fig.subplots_adjust(
+                left=0.13, right=0.97, top=1 - 0.38 / height, bottom=0.46 / height, hspace=0.08
+            )
+
+    def render(self, hist: pd.DataFrame, last_price: float, title: str) -> bytes:
+        x = mdates.date2num(hist.index.tz_localize(None) if hist.index.tz else hist.index)
+        close = hist["Close"].to_numpy(dtype="float64")
+        col = lambda name: hist[name].to_numpy(dtype="float64")
+        self.ma.set_data(x, col("MA20"))
+        self.last.set_offsets([[x[-1], last_price]])
+        lo_extra, hi_extra = last_price, last_price
+        if "bollinger" in self.indicators:
+            upper, lower = col("BB_upper"), col("BB_lower")
+            self.bb_upper.set_data(x, upper)
+            self.bb_lower.set_data(x, lower)
+            ok = ~np.isnan(upper)
+            self.bb_fill.set_verts([np.column_stack([np.r_[x[ok], x[ok][::-1]], np.r_[upper[ok], lower[ok][::-1]]])])
+            if ok.any():
+                lo_extra, hi_extra = min(lo_extra, np.nanmin(lower)), max(hi_extra, np.nanmax(upper))
+        if self.style == "candle":
+            o, h, l = (col(c) for c in ("Open", "High", "Low"))
+            colors = np.where(close >= o, self.UP, self.DOWN)
+            self.wicks.set_segments(np.stack([np.column_stack([x, l]), np.column_stack([x, h])], axis=1))
+            self.wicks.set_color(colors)
+            self.bodies.set_verts(_bar_verts(x, o, close, 0.3))
+            self.bodies.set_facecolor(colors)
+            self.bodies.set_edgecolor(colors)
+            lo, hi = min(np.nanmin(l), lo_extra), max(np.nanmax(h), hi_extra)
+            pad = (hi - lo) * 0.05 or 1.0
+            self.ax.set_xlim(x[0] - 1, x[-1] + 1)
+            self.ax.set_ylim(lo - pad, hi + pad)
+        else:
+            self.close.set_data(x, close)
+            self.fill.set_verts([np.column_stack([np.r_[x, x[::-1]], np.r_[np.nan_to_num(close), np.zeros(len(x))]])])
+            top = max(np.nanmax(close), hi_extra)
+            self.ax.set_xlim(x[0], x[-1])
+            self.ax.set_ylim(0, top * 1.05)
+        if "volume" in self.panels:
+            vol = np.nan_to_num(col("Volume")) if "Volume" in hist else np.zeros(len(x))
+            up = np.diff(close, prepend=close[0]) >= 0
+            self.vol_bars.set_verts(_bar_verts(x, np.zeros(len(x)), vol, 0.35))
+            self.vol_bars.set_facecolor(np.where(up, self.UP, self.DOWN))
+            self.vol_ma.set_data(x, col("VOL_MA"))
+            self.panels["volume"].set_ylim(0, (vol.max() or 1) * 1.1)
+        if "rsi" in self.panels:
+            self.rsi.set_data(x, col("RSI"))
+        if "macd" in self.panels:
+            macd, signal, bars = col("MACD"), col("signal"), np.nan_to_num(col("MACD_hist"))
+            self.macd.set_data(x, macd)
+            self.signal.set_data(x, signal)
+            self.macd_hist.set_verts(_bar_verts(x, np.zeros(len(x)), bars, 0.35))
+            self.macd_hist.set_facecolor(np.where(bars >= 0, self.UP, self.DOWN))
+            span = np.nanmax(np.abs(np.r_[macd, signal, bars])) if len(x) else 1.0
+            self.panels["macd"].set_ylim(-span * 1.15 or -1, span * 1.15 or 1)
+        self.title.set_text(title)
+        buf = io.BytesIO()
+        self.fig.savefig(buf, format="png")
+        return buf.getvalue()
+
+# (style, indicators) -> template, least recently used first; each holds an open figure
+_chart_templates: OrderedDict[tuple, ChartTemplate] = OrderedDict()
+_chart_templates_lock = threading.Lock()
+
+def render_chart_png(
+    hist: pd.DataFrame, last_price: float, title: str, style: str, reuse: bool = True, indicators: tuple = ()
+) -> bytes:
+    """Render the /stock chart (Close/OHLC with MA20 and the latest price) to PNG bytes.
+
+    reuse=True draws into one of this process's cached ChartTemplates (at most
+    CHART_TEMPLATES_MAX, least recently used closed first); reuse=False builds a
+    fresh figure (the original path without indicators, kept for --bench-charts).
+    """
+    if reuse:
+        key = (style, indicators)
+        with _chart_templates_lock:
+            template = _chart_templates.get(key)
+            if template is None:
+                template = _chart_templates[key] = ChartTemplate(style, indicators)
+                while len(_chart_templates) > max(1, CHART_TEMPLATES_MAX):
+                    plt.close(_chart_templates.popitem(last=False)[1].fig)
+            _chart_templates.move_to_end(key)
+            return template.render(hist, last_price, title)
 
     buf = io.BytesIO()
-    if USE_CANDLES and {"Open", "High", "Low", "Close"}.issubset(hist.columns):
+    if style == "candle":
         addplots = [
             mpf.make_addplot(hist["MA20"], color="orange", width=1.2),
             mpf.make_addplot(
-                pd.Series(last_price, index=[hist.index[-1]]),
+                pd.Series(last_price, index=[hist.index[-1]]).reindex(hist.index),
                 type="scatter",
                 color="white",
                 markersize=40,
@@ -1097,7 +3272,7 @@ def fetch_price_and_chart(symbol: str):
         fig, axes = mpf.plot(
             hist,
             type="candle",
-            style="charcoal",
+            style="nightclouds",
             addplot=addplots,
             returnfig=True,
             figsize=(7, 3.8),
@@ -1106,7 +3281,7 @@ def fetch_price_and_chart(symbol: str):
         locator = mdates.AutoDateLocator(minticks=3, maxticks=8)
         ax.xaxis.set_major_locator(locator)
         ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
-        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f"${x:,.2f}"))
+        ax.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"${x:,.2f}"))
         ax.set_title(title)
         fig.savefig(buf, format="png", bbox_inches="tight")
         plt.close(fig)
@@ -1127,47 +3302,465 @@ def fetch_price_and_chart(symbol: str):
         locator = mdates.AutoDateLocator(minticks=3, maxticks=8)
         ax.xaxis.set_major_locator(locator)
         ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
-        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f"${x:,.2f}"))
+        ax.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"${x:,.2f}"))
         ax.grid(color="gray", alpha=0.3)
         ax.set_title(title)
         fig.tight_layout()
         fig.savefig(buf, format="png", bbox_inches="tight")
         plt.close(fig)
 
-    buf.seek(0)
-    return sym, last_price, day_change_pct, month_change_pct, buf
+    return buf.getvalue()
+
+def chart_payload(hist: pd.DataFrame) -> dict:
+    """Plain NumPy arrays for a chart worker; no DataFrame crosses the process boundary."""
+    payload = {c: hist[c].to_numpy(dtype="float64") for c in hist.columns}
+    index = hist.index.tz_localize(None) if hist.index.tz else hist.index
+    payload["index"] = index.to_numpy(dtype="datetime64[ns]")
+    return payload
+
+def render_chart_arrays(payload: dict, last_price: float, title: str, style: str, indicators: tuple = ()) -> bytes:
+    """Chart worker entry point: rebuild the frame from arrays and return PNG bytes."""
+    index = pd.DatetimeIndex(payload["index"])
+    hist = pd.DataFrame({k: v for k, v in payload.items() if k != "index"}, index=index)
+    return render_chart_png(hist, last_price, title, style, indicators=indicators)
+
+def render_compare_png(payload: dict, title: str) -> bytes:
+    """One line per symbol, each rebased to 100 at the start of the window."""
+    x = mdates.date2num(pd.DatetimeIndex(payload["index"]))
+    with plt.style.context("dark_background"):
+        fig, ax = plt.subplots(figsize=(7, 3.8), dpi=150)
+        for name, series in zip(payload["columns"], payload["values"].T):
+            ax.plot(x, series, linewidth=1.6, label=name)
+        ax.axhline(100, color="gray", linewidth=0.8, linestyle="--")
+        locator = mdates.AutoDateLocator(minticks=3, maxticks=8)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        ax.yaxis.set_major_formatter(mticker.FuncFormatter(lambda v, _: f"{v - 100:+.0f}%"))
+        ax.grid(color="gray", alpha=0.3)
+        ax.legend(loc="upper left", fontsize=7, ncol=min(5, len(payload["columns"])), frameon=False)
+        ax.set_title(title)
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png")
+        plt.close(fig)
+    return buf.getvalue()
+
+def sample_history(days: int = 90) -> pd.DataFrame:
+    """Synthetic daily bars shaped like load_quote()'s output, for warm-ups and benchmarks."""
+    index = pd.date_range("2024-01-01", periods=days, freq="B")
+    close = pd.Series(100 + np.cumsum(np.random.default_rng(7).normal(0, 1, days)), index=index)
+    hist = pd.DataFrame(
+        {"Open": close.shift(1).fillna(close), "High": close + 1, "Low": close - 1, "Close": close,
+         "Volume": np.full(days, 1e6)}
+    )
+    hist = hist.join(indicator_frame(index, close.to_numpy(), hist["Volume"].to_numpy())[list(INDICATOR_COLUMNS)])
+    hist["MA20"] = hist["Close"].rolling(20).mean()
+    return hist
+
+def chart_styles() -> tuple[str, ...]:
+    return ("candle", "line") if USE_CANDLES else ("line",)
+
+_chart_ready_barrier = None
+
+def _chart_worker_init(barrier=None):
+    """Import the plotting stack once per worker and warm font/style caches with a tiny render."""
+    global _chart_ready_barrier
+    _chart_ready_barrier = barrier
+    warm = sample_history(30)
+    for style in chart_styles():
+        try:
+            render_chart_png(warm, float(warm["Close"].iloc[-1]), "warm-up", style)
+        except Exception as e:
+            print(f"Chart worker warm-up ({style}) failed:", e)
+
+def bench_charts(rounds: int = 20):
+    """Print per-chart render time for fresh figures vs reused templates."""
+    hist = sample_history()
+    last = float(hist["Close"].iloc[-1])
+    for style in chart_styles():
+        for reuse in (False, True):
+            render_chart_png(hist, last, "warm-up", style, reuse=reuse)
+            t0 = time.perf_counter()
+            for i in range(rounds):
+                render_chart_png(hist, last + i * 0.01, f"BENCH {i}", style, reuse=reuse)
+            ms = (time.perf_counter() - t0) * 1000 / rounds
+            print(f"{style:6} {'template' if reuse else 'fresh':8} {ms:7.1f} ms/chart")
+
+def _chart_worker_ping() -> int:
+    """Report in once warmed; the barrier holds each worker until all have, so every one answers."""
+    if _chart_ready_barrier is not None:
+        _chart_ready_barrier.wait(timeout=120)
+    return os.getpid()
+
+class ChartRenderer:
+    """Process pool for chart rendering so concurrent /stock calls use separate cores.
+
+    The pool starts lazily, from warm_up() or the first render, so a cold boot
+    doesn't pay for the workers' plotting imports. Workers come from a
+    forkserver (spawn where unavailable), since the gateway's threads already
+    exist by then, and each warms its own caches on start. Until they are ready,
+    with CHART_WORKERS=0, or if the pool breaks, rendering runs in a thread.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.pids: set[int] = set()
+        self._pool: ProcessPoolExecutor | None = None
+        self._warming: list = []
+        self._ready = False
+        self._waiter: asyncio.Task | None = None
+        self._disabled = workers <= 0
+
+    def _context(self):
+        methods = multiprocessing.get_all_start_methods()
+        return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+    def start(self):
+        """Create the pool and start its workers; they import and warm up on their own."""
+        if self._disabled or self._pool is not None:
+            return
+        context = self._context()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context,
+            initializer=_chart_worker_init, initargs=(context.Barrier(self.workers),),
+        )
+        self._warming = [self._pool.submit(_chart_worker_ping) for _ in range(self.workers)]
+
+    async def wait_ready(self):
+        """Wait until every worker has finished its warm-up render."""
+        if self._pool is None or self._ready:
+            return
+        try:
+            self.pids = set(await asyncio.gather(*(asyncio.wrap_future(f) for f in self._warming)))
+            self._ready = True
+            print(f"Chart renderer: {len(self.pids)} worker(s) warmed and ready")
+        except Exception as e:
+            print("Chart renderer unavailable, rendering in threads:", e)
+            self._shutdown()
+
+    def rss_mb(self) -> float:
+        return sum(rss_mb(pid) for pid in self.pids)
+
+    def _shutdown(self):
+        pool, self._pool = self._pool, None
+        self._ready = False
+        self._disabled = True
+        self.pids = set()
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        self._shutdown()
+
+    async def run(self, fn, *args) -> bytes:
+        """Run a picklable render function in the pool, or in a thread until it is ready."""
+        if self._pool is None and not self._disabled:
+            self.start()
+            self._waiter = asyncio.create_task(self.wait_ready())
+        if self._ready:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._pool, fn, *args)
+            except BrokenProcessPool:
+                print("Chart worker died; rendering in a thread until restart")
+                self._shutdown()
+        return await asyncio.to_thread(fn, *args)
+
+    async def render(
+        self, hist: pd.DataFrame, last_price: float, title: str, style: str, indicators: tuple = ()
+    ) -> bytes:
+        return await self.run(render_chart_arrays, chart_payload(hist), last_price, title, style, indicators)
+
+    async def render_compare(self, normalized: pd.DataFrame, title: str) -> bytes:
+        index = normalized.index.tz_localize(None) if normalized.index.tz else normalized.index
+        payload = {"index": index.to_numpy(dtype="datetime64[ns]"), "columns": list(normalized.columns), "values": normalized.to_numpy()}
+        return await self.run(render_compare_png, payload, title)
+
+chart_renderer = ChartRenderer(CHART_WORKERS)
+
+def load_quote(symbol: str, indicators: tuple = ()):
+    """Fetch history and the latest price for /stock (blocking; run via to_thread)."""
+    sym = normalize_symbol(symbol)
+    if sym is None:
+        return None
+    hist = get_daily_history(sym)
+    if hist.empty:
+        return None
+    if indicators:
+        hist = hist.join(indicators_for(sym, hist)[list(INDICATOR_COLUMNS)])
+
+    # trim to last 90 days if available
+    hist = hist.tail(90).copy()
+    hist["MA20"] = hist["Close"].rolling(20).mean()
+
+    closes = hist["Close"].dropna()
+
+    # intraday for freshest price fallback
+    intraday = get_intraday(sym)
+    if not intraday.empty and not intraday["Close"].dropna().empty:
+        last_price = float(intraday["Close"].dropna().iloc[-1])
+    else:
+        last_price = float(closes.iloc[-1])
+
+    # daily and monthly change percentages
+    prev_close = float(closes.iloc[-2]) if len(closes) >= 2 else last_price
+    month_close = float(closes.iloc[-21]) if len(closes) >= 21 else closes.iloc[0]
+    day_change_pct = ((last_price / prev_close) - 1) * 100 if prev_close else 0.0
+    month_change_pct = ((last_price / month_close) - 1) * 100 if month_close else 0.0
+    return sym, hist, last_price, day_change_pct, month_change_pct
+
+async def fetch_price_and_chart(symbol: str, indicators: tuple = ()):
+    quote = await asyncio.to_thread(load_quote, symbol, indicators)
+    if quote is None:
+        return None, None, None, None, None, None
+    sym, hist, last_price, day_change_pct, month_change_pct = quote
+
+    arrow = "▲" if day_change_pct >= 0 else "▼"
+    title = f"{sym}  {arrow} {abs(day_change_pct):.2f}%  •  Last price ${last_price:,.2f}"
+
+    style = "candle" if USE_CANDLES and {"Open", "High", "Low", "Close"}.issubset(hist.columns) else "line"
+    key = (sym, hist.index[-1].value, round(last_price, 4), style, indicators)
+    png = chart_cache.get(key)
+    if png is None:
+        png = await chart_renderer.render(hist, last_price, title, style, indicators)
+        chart_cache.set(key, png)
+    return sym, last_price, day_change_pct, month_change_pct, io.BytesIO(png), hist.iloc[-1]
+
+def stock_embed(sym: str, last_price: float, day_change_pct: float, month_change_pct: float,
+                latest: pd.Series, picked: tuple, unknown: list) -> discord.Embed:
+    """The /stock quote embed; the chart is attached as ``{sym}.png``."""
+    arrow_day = "▲" if day_change_pct >= 0 else "▼"
+    arrow_month = "▲" if month_change_pct >= 0 else "▼"
+    desc = (
+        f"**Last Price:** ${last_price:,.2f}\n"
+        f"**Day Change:** {arrow_day} {abs(day_change_pct):.2f}%\n"
+        f"**Month Change:** {arrow_month} {abs(month_change_pct):.2f}%\n"
+    )
+    readings = []
+    if "rsi" in picked:
+        readings.append(f"RSI(14) {latest['RSI']:.1f}")
+    if "macd" in picked:
+        readings.append(f"MACD {latest['MACD']:+.2f} / signal {latest['signal']:+.2f}")
+    if "bollinger" in picked:
+        readings.append(f"Bands ${latest['BB_lower']:,.2f}–${latest['BB_upper']:,.2f}")
+    if readings:
+        desc += f"**Indicators:** {' • '.join(readings)}\n"
+    if unknown:
+        desc += f"Unknown indicator(s) ignored: {', '.join(unknown)}\n"
+    desc += (
+        "🟢 Price • 🟡 20-day moving average • ⚪ Latest price"
+        f"\n\nhttps://www.tradingview.com/symbols/{sym}"
+    )
+    embed = emb(f"Stocks | {sym}", desc)
+    embed.set_image(url=f"attachment://{sym}.png")
+    return embed
+
+class LiveQuotes:
+    """One shared poller behind every /stock live message.
+
+    Each tick refreshes the intraday bars of all watched symbols in a single
+    batched download, renders each (symbol, indicators) chart once and edits every
+    subscribed message with it. Subscriptions lapse after LIVE_MINUTES, before the
+    interaction token that allows editing them expires.
+    """
+
+    def __init__(self, tick_sec: float, minutes: float, max_subs: int, max_per_user: int):
+        self.tick_sec = tick_sec
+        self.minutes = minutes
+        self.max_subs = max_subs
+        self.max_per_user = max_per_user
+        self.subs: dict[int, dict] = {}
+        self._task: asyncio.Task | None = None
+
+    def check(self, user_id: int) -> str | None:
+        if not market_is_open():
+            return "The market is closed, so there is nothing to follow live."
+        if len(self.subs) >= self.max_subs:
+            return "Too many live quotes are running right now; try again later."
+        if sum(1 for sub in self.subs.values() if sub["user_id"] == user_id) >= self.max_per_user:
+            return f"You already have {self.max_per_user} live quote(s) running."
+        return None
+
+    def footer(self, until: float | None = None) -> str:
+        until = until or time.time() + self.minutes * 60
+        ends = dt.datetime.fromtimestamp(until, dt.timezone.utc).strftime("%H:%M UTC")
+        return f"Live • updates every {self.tick_sec:.0f}s until {ends}"
+
+    def subscribe(self, message: discord.WebhookMessage, user_id: int, sym: str, indicators: tuple, unknown: list):
+        self.subs[message.id] = {
+            "message": message, "user_id": user_id, "sym": sym, "indicators": indicators,
+            "unknown": unknown, "expires": time.time() + self.minutes * 60, "key": None,
+        }
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def _expire(self, sub: dict):
+        try:
+            embed = sub["message"].embeds[0] if sub["message"].embeds else None
+            if embed:
+                embed.set_footer(text="Live updates ended")
+                await sub["message"].edit(embed=embed)
+        except discord.HTTPException:
+            pass
+
+    async def _edit(self, message_id: int, embed: discord.Embed, png: bytes, sym: str):
+        sub = self.subs.get(message_id)
+        if not sub:
+            return
+        try:
+            sub["message"] = await sub["message"].edit(
+                embed=embed, attachments=[discord.File(io.BytesIO(png), filename=f"{sym}.png")]
+            )
+        except discord.HTTPException as e:  # deleted, or the token lapsed
+            print(f"Live quote {message_id} dropped: {e}")
+            self.subs.pop(message_id, None)
+
+    async def tick(self):
+        now = time.time()
+        for message_id, sub in list(self.subs.items()):
+            if sub["expires"] <= now:
+                self.subs.pop(message_id, None)
+                await self._expire(sub)
+        if not self.subs or not market_is_open():
+            return
+        symbols = sorted({sub["sym"] for sub in self.subs.values()})
+        await asyncio.to_thread(get_daily_histories, symbols)
+        await asyncio.to_thread(refresh_intraday, symbols)
+
+        groups: dict[tuple, list[int]] = {}
+        for message_id, sub in self.subs.items():
+            groups.setdefault((sub["sym"], sub["indicators"]), []).append(message_id)
+        for (sym, indicators), message_ids in groups.items():
+            try:
+                _, last_price, day_pct, month_pct, img, latest = await fetch_price_and_chart(sym, indicators)
+            except Exception as e:
+                print(f"Live quote refresh for {sym} failed: {e}")
+                continue
+            if last_price is None:
+                continue
+            png = img.getvalue()
+            edits = []
+            for message_id in message_ids:
+                sub = self.subs[message_id]
+                key = (round(last_price, 4), latest.name)
+                if sub["key"] == key:
+                    continue  # nothing moved since the last edit
+                sub["key"] = key
+                embed = stock_embed(sym, last_price, day_pct, month_pct, latest, indicators, sub["unknown"])
+                embed.set_footer(text=self.footer(sub["expires"]))
+                edits.append(self._edit(message_id, embed, png, sym))
+            await asyncio.gather(*edits)
+
+    async def run(self):
+        while self.subs:
+            await asyncio.sleep(self.tick_sec)
+            try:
+                await self.tick()
+            except Exception as e:
+                print("Live quote tick failed:", e)
+
+live_quotes = LiveQuotes(LIVE_TICK_SEC, LIVE_MINUTES, LIVE_MAX_SUBSCRIPTIONS, LIVE_MAX_PER_USER)
+
+def unknown_symbol_embed(text: str) -> discord.Embed:
+    hints = ", ".join(f"`{sym}`" for sym, _ in ticker_index.suggest(text.split(",")[0], 5))
+    return emb("Stock", f"`{text}` isn't a known ticker." + (f" Did you mean {hints}?" if hints else ""))
+
+async def symbol_autocomplete(inter: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """Suggest tickers for the last symbol typed (earlier ones in a list are kept)."""
+    parts = re.split(r"([\s,;]+)", current)
+    head, last = "".join(parts[:-1]), parts[-1]
+    choices = suggest_symbols(last)
+    if head:
+        choices = [app_commands.Choice(name=f"{head}{c.value}"[:100], value=f"{head}{c.value}"[:100]) for c in choices]
+    return choices
 
 @tree.command(name="stock", description="Show current price and chart for a stock")
-@app_commands.describe(symbol="Ticker (e.g., AAPL, TSLA)")
+@app_commands.describe(
+    symbol="Ticker (e.g., AAPL, TSLA); for compare, several separated by spaces or commas",
+    mode="quote (default), compare several tickers, or live: keep the quote updating for a few minutes",
+    indicators="Overlays for quote: rsi, macd, bollinger (bb), volume — comma separated",
+)
+@app_commands.choices(mode=[app_commands.Choice(name="quote", value="quote"), app_commands.Choice(name="compare", value="compare"), app_commands.Choice(name="live", value="live")])
 @cooldown_medium
 @app_commands.default_permissions(use_application_commands=True)
-async def stock(inter: discord.Interaction, symbol: str):
+@app_commands.autocomplete(symbol=symbol_autocomplete)
+async def stock(
+    inter: discord.Interaction, symbol: str, mode: app_commands.Choice[str] | None = None, indicators: str | None = None
+):
     await inter.response.defer(ephemeral=use_ephemeral(inter), thinking=True)
     try:
-        sym, last_price, day_change_pct, month_change_pct, img = await asyncio.to_thread(
-            fetch_price_and_chart, symbol
-        )
+        if mode and mode.value == "compare":
+            symbols, rejected = normalize_symbols(symbol)
+            if not symbols:
+                return await inter.followup.send(embed=unknown_symbol_embed(symbol), ephemeral=use_ephemeral(inter))
+            title = " vs ".join(symbols) if len(symbols) <= 4 else f"{len(symbols)} tickers"
+            return await send_comparison(inter, symbols, title, rejected)
+        if normalize_symbol(symbol) is None:
+            return await inter.followup.send(embed=unknown_symbol_embed(symbol), ephemeral=use_ephemeral(inter))
+        picked, unknown = parse_indicators(indicators)
+        sym, last_price, day_change_pct, month_change_pct, img, latest = await fetch_price_and_chart(symbol, picked)
         if sym is None:
             return await inter.followup.send(
                 embed=emb("Stock", f"Couldn't find data for `{symbol}`."), ephemeral=use_ephemeral(inter)
             )
 
-        arrow_day = "▲" if day_change_pct >= 0 else "▼"
-        arrow_month = "▲" if month_change_pct >= 0 else "▼"
-        desc = (
-            f"**Last Price:** ${last_price:,.2f}\n"
-            f"**Day Change:** {arrow_day} {abs(day_change_pct):.2f}%\n"
-            f"**Month Change:** {arrow_month} {abs(month_change_pct):.2f}%\n"
-            "🟢 Price • 🟡 20-day moving average • ⚪ Latest price"
-            f"\n\nhttps://www.tradingview.com/symbols/{sym}"
-        )
+        embed = stock_embed(sym, last_price, day_change_pct, month_change_pct, latest, picked, unknown)
         file = discord.File(img, filename=f"{sym}.png")
-        embed = emb(f"Stocks | {sym}", desc)
-        embed.set_image(url=f"attachment://{sym}.png")
-        await inter.followup.send(embed=embed, file=file, ephemeral=use_ephemeral(inter))
+        live = bool(mode and mode.value == "live")
+        if live:
+            refused = live_quotes.check(inter.user.id)
+            if refused:
+                embed.add_field(name="Live", value=refused, inline=False)
+                live = False
+            else:
+                embed.set_footer(text=live_quotes.footer())
+        message = await inter.followup.send(embed=embed, file=file, ephemeral=use_ephemeral(inter), wait=True)
+        if live:
+            live_quotes.subscribe(message, inter.user.id, sym, picked, unknown)
     except Exception as e:
         await inter.followup.send(embed=emb("Stock", f"Error: {e}"), ephemeral=use_ephemeral(inter))
 
+watchlist_group = app_commands.Group(
+    name="watchlist",
+    description="Your saved tickers, quoted together.",
+    default_permissions=discord.Permissions(use_application_commands=True),
+    guild_ids=[GUILD_ID] if GUILD_ID else None,
+)
+
+@watchlist_group.command(name="show", description="Quote every ticker on your watchlist in one table and chart.")
+@cooldown_medium
+async def watchlist_show_cmd(inter: discord.Interaction):
+    symbols = watchlists.get(inter.user.id)
+    if not symbols:
+        return await reply_embed(inter, "Watchlist", "Your watchlist is empty. Add tickers with `/watchlist add`.", ephemeral=True)
+    await inter.response.defer(ephemeral=use_ephemeral(inter), thinking=True)
+    try:
+        await send_comparison(inter, symbols, f"{inter.user.display_name}'s watchlist")
+    except Exception as e:
+        await inter.followup.send(embed=emb("Watchlist", f"Error: {e}"), ephemeral=use_ephemeral(inter))
+
+@watchlist_group.command(name="add", description="Add tickers to your watchlist.")
+@app_commands.describe(symbols="One or more tickers separated by spaces or commas")
+@app_commands.autocomplete(symbols=symbol_autocomplete)
+@cooldown_fast
+async def watchlist_add_cmd(inter: discord.Interaction, symbols: str):
+    valid, rejected = normalize_symbols(symbols)
+    current = watchlists.add(inter.user.id, valid)
+    note = f" (limit {watchlists.limit})" if len(current) >= watchlists.limit else ""
+    desc = f"Watching {len(current)} ticker(s){note}: {', '.join(current) or '—'}"
+    if rejected:
+        desc += f"\nNot a known ticker: {', '.join(rejected)}"
+    await reply_embed(inter, "Watchlist", desc, ephemeral=True)
+
+@watchlist_group.command(name="remove", description="Remove tickers from your watchlist.")
+@app_commands.describe(symbols="One or more tickers separated by spaces or commas")
+@cooldown_fast
+async def watchlist_remove_cmd(inter: discord.Interaction, symbols: str):
+    current = watchlists.remove(inter.user.id, normalize_symbols(symbols, limit=watchlists.limit)[0])
+    await reply_embed(inter, "Watchlist", f"Watching {len(current)} ticker(s): {', '.join(current) or '—'}", ephemeral=True)
+
+tree.add_command(watchlist_group)
+
 @tree.error
 async def on_app_command_error(inter: discord.Interaction, error: app_commands.AppCommandError):
     if isinstance(error, app_commands.CommandOnCooldown):
@@ -1183,10 +3776,13 @@ async def on_app_command_error(inter: discord.Interaction, error: app_commands.A
     raise error
 
 if __name__ == "__main__":
+    if "--bench-charts" in sys.argv:
+        raise SystemExit(bench_charts())
     if not TOKEN:
         raise SystemExit("Set DISCORD_TOKEN")
+    print(f"Loaded in {time.perf_counter() - BOOT_STARTED:.2f}s • RSS {rss_mb():.0f} MB")
     try:
         client.run(TOKEN)
     finally:
-        if _http and not _http.closed:
-            asyncio.run(_http.close())
+        chart_renderer.close()
+        asyncio.run(http_client.close())